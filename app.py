@@ -1,19 +1,36 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import requests
 import json
-from datetime import datetime, timedelta
+import functools
+import hashlib
+import random
+import sqlite3
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
 import time
-from typing import Dict, List, Optional
+import threading
+import logging
+from collections import OrderedDict, deque
+from contextlib import nullcontext
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import count, repeat
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+from urllib.parse import urlsplit
 import os
 from dotenv import load_dotenv
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 
 # Load environment variables
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Page configuration
 st.set_page_config(
     page_title="Crypto Treasury Tracker",
@@ -47,145 +64,1713 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-class TreasuryTracker:
+# Coins the tracker follows. Any coin served by /companies/public_treasury/{coin_id}
+# can be added here; fetching, processing and rendering all work off this registry.
+COINS = {
+    'bitcoin': {'symbol': 'BTC', 'name': 'Bitcoin', 'max_supply': 21_000_000},
+    'ethereum': {'symbol': 'ETH', 'name': 'Ethereum', 'max_supply': None},
+}
+
+# Display prefix per supported fiat currency
+CURRENCY_SYMBOLS = {"USD": "$", "EUR": "€", "GBP": "£", "JPY": "¥", "CAD": "C$", "AUD": "A$"}
+
+# Bump whenever process_treasury_data changes its output, so memoized frames are rebuilt
+PROCESSED_SCHEMA_VERSION = 2
+
+# Raw company field -> (DataFrame column, default for missing values)
+TREASURY_FIELDS = {
+    'name': ('Name', 'Unknown'),
+    'symbol': ('Symbol', 'N/A'),
+    'country': ('Country', 'Unknown'),
+    'total_holdings': ('Total Holdings', 0.0),
+    'total_entry_value_usd': ('Entry Value', 0.0),
+    'total_current_value_usd': ('Current Value', 0.0),
+    'percentage_of_total_supply': ('% of Total Supply', 0.0),
+}
+
+# Monte Carlo fallbacks when no price history is available (annualized), and the
+# memory budget for one chunk of the (paths x companies) PnL matrix
+DEFAULT_GBM_DRIFT = 0.0
+DEFAULT_GBM_VOLATILITY = 0.7
+DEFAULT_GBM_CORRELATION = 0.8
+SIMULATION_CHUNK_BYTES = 64 * 2**20
+
+# Histogram buckets (seconds) of the exported upstream latency and rerun render time
+UPSTREAM_LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+RENDER_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10]
+
+
+def revalue_holdings(df: pd.DataFrame, price_usd: float) -> pd.DataFrame:
+    """Recompute Current Value, PnL and PnL % of a processed frame at a new USD price.
+
+    Holdings and entry values are reused as-is, so this is three array
+    operations over the cached frame instead of a treasury refetch.
+    """
+    entry = df['Entry Value'].to_numpy(dtype=float)
+    current = df['Total Holdings'].to_numpy(dtype=float) * price_usd
+    pnl = current - entry
+    return df.assign(**{
+        'Current Value': current,
+        'PnL': pnl,
+        'PnL %': np.divide(pnl * 100, entry, out=np.zeros_like(pnl), where=entry != 0),
+    })
+
+
+def usd_cross_rates(exchange_rates: Dict) -> Dict[str, float]:
+    """Units of each supported fiat per USD, from CoinGecko's exchange_rates payload.
+
+    Every rate there is quoted per BTC, so X per USD is rates[x] / rates['usd'].
+    Currencies without a positive rate are left out.
+    """
+    usd = float((exchange_rates.get('usd') or {}).get('value') or 0)
+    if usd <= 0:
+        raise UpstreamError("exchange_rates has no USD rate")
+    rates = {"USD": 1.0}
+    for code in CURRENCY_SYMBOLS:
+        value = float((exchange_rates.get(code.lower()) or {}).get('value') or 0)
+        if code != "USD" and value > 0:
+            rates[code] = value / usd
+    return rates
+
+
+def diff_snapshots(old: pd.DataFrame, new: pd.DataFrame, include_unchanged: bool = False) -> pd.DataFrame:
+    """Compare two process_treasury_data outputs company by company.
+
+    Both frames are aligned on (Name, Symbol) and compared as whole columns.
+    Each row gets a Change of 'new', 'dropped', 'changed' or 'unchanged' plus
+    before/after/delta columns for Total Holdings and Entry Value. Rows are
+    ranked by the size of the holdings move, then the entry value move.
+    """
+    keys = ['Name', 'Symbol']
+    values = ['Total Holdings', 'Entry Value']
+
+    def keyed(df: pd.DataFrame) -> pd.DataFrame:
+        if df is None or df.empty:
+            return pd.DataFrame(columns=keys + values).set_index(keys)
+        # Duplicate listings of one company are merged so the keys stay unique
+        return df.groupby(keys, sort=False)[values].sum()
+
+    before, after = keyed(old), keyed(new)
+    index = before.index.union(after.index)
+    in_before = index.isin(before.index)
+    in_after = index.isin(after.index)
+    before = before.reindex(index).fillna(0).to_numpy(dtype=float)
+    after = after.reindex(index).fillna(0).to_numpy(dtype=float)
+    delta = after - before
+
+    change = np.select(
+        [~in_before, ~in_after, (delta != 0).any(axis=1)],
+        ['new', 'dropped', 'changed'],
+        default='unchanged',
+    )
+    diff = pd.DataFrame({
+        'Name': index.get_level_values('Name'),
+        'Symbol': index.get_level_values('Symbol'),
+        'Change': change,
+        'Holdings Before': before[:, 0],
+        'Holdings After': after[:, 0],
+        'Holdings Change': delta[:, 0],
+        'Entry Value Before': before[:, 1],
+        'Entry Value After': after[:, 1],
+        'Entry Value Change': delta[:, 1],
+    })
+    if not include_unchanged:
+        diff = diff[diff['Change'] != 'unchanged']
+    order = np.lexsort((-np.abs(diff['Entry Value Change'].to_numpy()), -np.abs(diff['Holdings Change'].to_numpy())))
+    return diff.iloc[order].reset_index(drop=True)
+
+
+class CompanyIndex:
+    """Process-wide mapping from company identity (Name, Symbol, Country) to a dense integer id.
+
+    Ids are assigned once per processed snapshot and never change, so frames
+    from different coins and fetches can be aligned by array position.
+    """
+
+    def __init__(self):
+        self._ids: Dict[Tuple[str, str, str], int] = {}
+        self._labels: Dict[str, List[str]] = {'Company': [], 'Symbol': [], 'Country': []}
+        self._label_arrays: Tuple[int, Dict[str, np.ndarray]] = (0, {})
+        self._lock = threading.Lock()
+
+    def ids_for(self, names: pd.Series, symbols: pd.Series, countries: pd.Series) -> np.ndarray:
+        """Ids for each row, registering identities seen for the first time"""
+        # Factorize column by column and fold the codes together; unlike a tuple
+        # MultiIndex this stays in integer arrays, and codes never exceed the row count
+        columns = [np.asarray(names, dtype=object), np.asarray(symbols, dtype=object), np.asarray(countries, dtype=object)]
+        codes = np.zeros(len(columns[0]), dtype=np.int64)
+        for column in columns:
+            column_codes, column_uniques = pd.factorize(column, use_na_sentinel=False)
+            codes, _ = pd.factorize(codes * len(column_uniques) + column_codes)
+        # Codes number identities 0..k-1 in order of first appearance; np.unique gives each one's first row
+        first = np.unique(codes, return_index=True)[1]
+        uniques = zip(*(column[first] for column in columns))
+        with self._lock:
+            unique_ids = np.empty(len(first), dtype=np.int64)
+            for i, key in enumerate(uniques):
+                company_id = self._ids.get(key)
+                if company_id is None:
+                    company_id = self._ids[key] = len(self._ids)
+                    for column, value in zip(self._labels, key):
+                        self._labels[column].append(value)
+                unique_ids[i] = company_id
+        return unique_ids[codes]
+
+    def labels(self, ids: np.ndarray) -> Dict[str, np.ndarray]:
+        """Company, Symbol and Country columns for the given ids"""
+        with self._lock:
+            size, arrays = self._label_arrays
+            if size != len(self._ids):
+                arrays = {column: np.array(values, dtype=object) for column, values in self._labels.items()}
+                self._label_arrays = (len(self._ids), arrays)
+        return {column: values[ids] for column, values in arrays.items()}
+
+
+def combine_coin_frames(frames: Dict[str, pd.DataFrame], index: CompanyIndex) -> pd.DataFrame:
+    """Outer-join processed per-coin frames on their Company ID.
+
+    frames maps a coin symbol (e.g. 'BTC') to its process_treasury_data
+    output. The union of company ids becomes the row axis and each coin's
+    values are scattered into it by position, so N coins cost N array
+    lookups instead of N-way string merges. Every coin gets '<SYM> Held',
+    'EntryUSD_<SYM>' and 'CurrentUSD_<SYM>' columns (0 where a company does
+    not hold it), followed by USD totals and Total PnL.
+    """
+    present = [df['Company ID'].to_numpy() for df in frames.values() if df is not None and not df.empty]
+    ids = np.unique(np.concatenate(present)) if present else np.empty(0, dtype=np.int64)
+    columns: Dict[str, Any] = index.labels(ids)
+    total_entry = np.zeros(len(ids))
+    total_current = np.zeros(len(ids))
+    for symbol, df in frames.items():
+        for source, target in [('Total Holdings', f'{symbol} Held'), ('Entry Value', f'EntryUSD_{symbol}'),
+                               ('Current Value', f'CurrentUSD_{symbol}')]:
+            if df is None or df.empty:
+                columns[target] = np.zeros(len(ids))
+                continue
+            # Duplicate listings of a company within one coin are summed
+            positions = np.searchsorted(ids, df['Company ID'].to_numpy())
+            columns[target] = np.bincount(positions, weights=df[source].to_numpy(dtype=float), minlength=len(ids))
+        total_entry += columns[f'EntryUSD_{symbol}']
+        total_current += columns[f'CurrentUSD_{symbol}']
+    columns['Total Entry Value'] = total_entry
+    columns['Total Current Value'] = total_current
+    columns['Total PnL'] = total_current - total_entry
+    return pd.DataFrame(columns)
+
+
+class ScenarioEngine:
+    """What-if PnL of a combine_coin_frames table at hypothetical USD coin prices.
+
+    Holdings and current values are pulled out once as (companies x coins)
+    matrices, so a scenario is one masked multiply and a price grid is a
+    broadcast over the holdings, with no per-company or per-cell loops.
+    Coins without a scenario price keep their current value.
+    """
+
+    def __init__(self, holdings: pd.DataFrame, symbols: List[str]):
+        self.symbols = list(symbols)
+        self.labels = holdings[['Company', 'Symbol', 'Country']].reset_index(drop=True)
+        self.held = holdings[[f'{s} Held' for s in self.symbols]].to_numpy(dtype=float)
+        self.current = holdings[[f'CurrentUSD_{s}' for s in self.symbols]].to_numpy(dtype=float)
+        self.entry = holdings['Total Entry Value'].to_numpy(dtype=float)
+
+    def implied_prices(self) -> Dict[str, float]:
+        """USD price per coin implied by current value / holdings (0 if nothing is held)"""
+        held, current = self.held.sum(axis=0), self.current.sum(axis=0)
+        prices = np.divide(current, held, out=np.zeros_like(current), where=held > 0)
+        return dict(zip(self.symbols, prices.tolist()))
+
+    def _values(self, prices: Dict[str, float], exclude: Tuple[str, ...] = ()) -> np.ndarray:
+        """Per-company USD value of every coin not in exclude, at the scenario prices"""
+        keep = np.array([s not in exclude for s in self.symbols])
+        priced = np.array([s in prices for s in self.symbols])
+        price = np.array([prices.get(s, 0.0) for s in self.symbols], dtype=float)
+        values = np.where(priced, self.held * price, self.current)
+        return values[:, keep].sum(axis=1)
+
+    def company_pnl(self, prices: Dict[str, float]) -> pd.DataFrame:
+        """Scenario Value, Scenario PnL and Scenario PnL % for every company"""
+        value = self._values(prices)
+        pnl = value - self.entry
+        return self.labels.assign(**{
+            'Scenario Value': value,
+            'Scenario PnL': pnl,
+            'Scenario PnL %': np.divide(pnl * 100, self.entry, out=np.zeros_like(pnl), where=self.entry != 0),
+        })
+
+    def total_pnl(self, prices: Dict[str, float]) -> float:
+        """Aggregate PnL across all companies at the scenario prices"""
+        return float(self._values(prices).sum() - self.entry.sum())
+
+    def pnl_grid(self, x_symbol: str, x_prices: np.ndarray, y_symbol: Optional[str] = None,
+                 y_prices: Optional[np.ndarray] = None, prices: Optional[Dict[str, float]] = None,
+                 per_company: bool = False) -> np.ndarray:
+        """PnL over a grid of x (and optionally y) coin prices.
+
+        The result has shape (len(x_prices),), or (len(y_prices), len(x_prices))
+        with cell [i, j] pricing y at y_prices[i] and x at x_prices[j]. Coins
+        off the axes are valued at prices, else at their current value. The
+        aggregate grid only broadcasts per-coin totals; per_company adds a
+        leading companies axis and costs companies x cells floats.
+        """
+        axes = (x_symbol,) if y_symbol is None else (x_symbol, y_symbol)
+        x = np.asarray(x_prices, dtype=float)
+        held = self.held[:, [self.symbols.index(s) for s in axes]]
+        rest = self._values(prices or {}, exclude=axes) - self.entry
+        if not per_company:
+            held, rest = held.sum(axis=0, keepdims=True), np.array([rest.sum()])
+        if y_symbol is None:
+            grid = rest[:, None] + held[:, 0, None] * x
+        else:
+            y = np.asarray(y_prices, dtype=float)
+            grid = rest[:, None, None] + held[:, 0, None, None] * x + held[:, 1, None, None] * y[:, None]
+        return grid if per_company else grid[0]
+
+
+class BreakevenIndex:
+    """Companies of one coin sorted by breakeven price (Entry Value / Total Holdings).
+
+    A company is underwater at price P when its breakeven is above P. With
+    the breakevens sorted and holdings/entry values summed from the top,
+    every query is a binary search plus a couple of lookups, and a whole
+    price curve is one vectorized searchsorted. Companies without holdings
+    or a disclosed entry value have no cost basis and are left out.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        holdings = df['Total Holdings'].to_numpy(dtype=float) if not df.empty else np.empty(0)
+        entry = df['Entry Value'].to_numpy(dtype=float) if not df.empty else np.empty(0)
+        known = (holdings > 0) & (entry > 0)
+        breakeven = entry[known] / holdings[known]
+        order = np.argsort(breakeven, kind='stable')
+        self.breakeven = breakeven[order]
+        # Suffix sums: [k] covers the companies from sorted position k to the end
+        self._held_from = np.append(np.cumsum(holdings[known][order][::-1])[::-1], 0.0)
+        self._entry_from = np.append(np.cumsum(entry[known][order][::-1])[::-1], 0.0)
+
+    def __len__(self) -> int:
+        return len(self.breakeven)
+
+    def underwater(self, prices: Any) -> pd.DataFrame:
+        """Underwater count, share, value and unrealized loss at each price (scalar or array)"""
+        prices = np.atleast_1d(np.asarray(prices, dtype=float))
+        first = np.searchsorted(self.breakeven, prices, side='right')
+        count = len(self) - first
+        value = prices * self._held_from[first]
+        return pd.DataFrame({
+            'Price': prices,
+            'Underwater Companies': count,
+            'Underwater %': count * 100 / len(self) if len(self) else np.zeros(len(prices)),
+            'Underwater Value': value,
+            'Unrealized Loss': value - self._entry_from[first],
+        })
+
+    def price_for_underwater_share(self, share: float) -> Optional[float]:
+        """Breakeven price below which at least share (0-1] of the companies are underwater"""
+        needed = int(np.ceil(share * len(self)))
+        if not len(self) or not 0 < needed <= len(self):
+            return None
+        return float(self.breakeven[len(self) - needed])
+
+
+def estimate_gbm_params(history: pd.DataFrame, symbols: List[str],
+                        min_returns: int = 30) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Annualized GBM drift, volatility and correlation from daily closes.
+
+    history has one column of USD prices per coin symbol, indexed by day.
+    Coins missing from it, or with fewer than min_returns aligned daily
+    returns, keep the DEFAULT_GBM_* values.
+    """
+    k = len(symbols)
+    drift = np.full(k, DEFAULT_GBM_DRIFT)
+    volatility = np.full(k, DEFAULT_GBM_VOLATILITY)
+    correlation = np.full((k, k), DEFAULT_GBM_CORRELATION)
+    np.fill_diagonal(correlation, 1.0)
+    known = [i for i, symbol in enumerate(symbols) if symbol in history.columns]
+    if not known:
+        return drift, volatility, correlation
+    returns = np.log(history[[symbols[i] for i in known]].where(lambda h: h > 0)).diff().dropna()
+    if len(returns) < min_returns:
+        return drift, volatility, correlation
+    daily_mean, daily_std = returns.mean().to_numpy(), returns.std().to_numpy()
+    volatility[known] = daily_std * np.sqrt(365)
+    # E[log return] = (mu - sigma^2 / 2) dt, so the GBM drift adds the variance back
+    drift[known] = daily_mean * 365 + volatility[known] ** 2 / 2
+    observed = returns.corr().to_numpy()
+    correlation[np.ix_(known, known)] = np.where(np.isnan(observed), DEFAULT_GBM_CORRELATION, observed)
+    np.fill_diagonal(correlation, 1.0)
+    return drift, volatility, correlation
+
+
+def _company_pnl_percentiles(prices: np.ndarray, held: np.ndarray, entry: np.ndarray,
+                             percentiles: Tuple[float, ...]) -> np.ndarray:
+    """PnL percentiles over paths for one chunk of companies (module level so a process pool can run it)"""
+    # One row per company keeps each partition contiguous in memory
+    return np.percentile(held @ prices.T - entry[:, None], percentiles, axis=1)
+
+
+class MonteCarloSimulator:
+    """Treasury PnL under correlated geometric Brownian motion of coin prices.
+
+    PnL at the horizon only depends on each coin's terminal price, so those
+    are drawn exactly from the joint lognormal distribution instead of
+    stepping whole paths. Per-company distributions are reduced to
+    percentiles one chunk of companies at a time, which bounds memory at any
+    path count and lets the chunks run in a process pool. Companies holding a
+    single coin skip the sort entirely.
+    """
+
+    def __init__(self, engine: ScenarioEngine, drift: np.ndarray, volatility: np.ndarray, correlation: np.ndarray):
+        self.engine = engine
+        implied = engine.implied_prices()
+        self.spot = np.array([implied[symbol] for symbol in engine.symbols])
+        self.drift = np.asarray(drift, dtype=float)
+        self.volatility = np.asarray(volatility, dtype=float)
+        try:
+            self._cholesky = np.linalg.cholesky(correlation)
+        except np.linalg.LinAlgError:
+            # Not positive definite (e.g. a noisy estimate): simulate the coins independently
+            self._cholesky = np.eye(len(self.spot))
+
+    def terminal_prices(self, n_paths: int, horizon_days: float, seed: Optional[int] = None) -> np.ndarray:
+        """(n_paths, coins) USD prices after horizon_days"""
+        t = horizon_days / 365
+        shocks = np.random.default_rng(seed).standard_normal((n_paths, len(self.spot))) @ self._cholesky.T
+        return self.spot * np.exp((self.drift - self.volatility ** 2 / 2) * t + self.volatility * np.sqrt(t) * shocks)
+
+    def aggregate_pnl(self, prices: np.ndarray) -> np.ndarray:
+        """Total PnL across all companies on each path"""
+        return prices @ self.engine.held.sum(axis=0) - self.engine.entry.sum()
+
+    def current_pnl(self) -> np.ndarray:
+        """Per-company PnL at today's prices"""
+        return self.engine.current.sum(axis=1) - self.engine.entry
+
+    def company_risk(self, prices: np.ndarray, confidence: float = 0.95, workers: int = 0) -> pd.DataFrame:
+        """Per-company PnL percentiles (tail, median, upside) and VaR at the given confidence"""
+        percentiles = ((1 - confidence) * 100, 50.0, confidence * 100)
+        held, entry = self.engine.held, self.engine.entry
+        values = np.empty((len(percentiles), len(entry)))
+        # A company holding one coin has PnL increasing in that coin's price alone,
+        # so its percentiles follow exactly from the price percentiles without a sort
+        single = (held > 0).sum(axis=1) <= 1
+        price_percentiles = np.percentile(prices, percentiles, axis=0)
+        values[:, single] = price_percentiles @ held[single].T - entry[single]
+
+        multi = np.flatnonzero(~single)
+        chunk = max(1, SIMULATION_CHUNK_BYTES // (8 * max(len(prices), 1)))
+        starts = range(0, len(multi), chunk)
+        chunks = ([held[multi[i:i + chunk]] for i in starts], [entry[multi[i:i + chunk]] for i in starts])
+        if workers > 1 and len(starts) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                parts = list(pool.map(_company_pnl_percentiles, repeat(prices), *chunks, repeat(percentiles)))
+        else:
+            parts = list(map(_company_pnl_percentiles, repeat(prices), *chunks, repeat(percentiles)))
+        if parts:
+            values[:, multi] = np.concatenate(parts, axis=1)
+        low, median, high = values
+        current = self.current_pnl()
+        return self.engine.labels.assign(**{
+            'Current PnL': current,
+            f'PnL P{percentiles[0]:g}': low,
+            'PnL P50': median,
+            f'PnL P{percentiles[2]:g}': high,
+            f'VaR {confidence:.0%}': np.maximum(current - low, 0),
+        })
+
+    @staticmethod
+    def value_at_risk(pnl: np.ndarray, current_pnl: float, confidence: float = 0.95) -> Tuple[float, float]:
+        """VaR and expected shortfall of the fall from current_pnl across simulated paths"""
+        losses = current_pnl - np.asarray(pnl, dtype=float)
+        var = float(np.percentile(losses, confidence * 100))
+        return var, float(losses[losses >= var].mean())
+
+
+class TTLCache:
+    """Thread-safe cache with TTL eviction, shared by every session in the process.
+
+    Entries older than ``ttl`` are stale: ``get`` ignores them but ``get_entry``
+    still returns them until they pass ``max_stale`` and are evicted. Entries
+    stored with ``keep=True`` (last-known-good data restored from disk) are
+    never evicted for age, only replaced by the next ``set`` of their key.
+    """
+
+    def __init__(self, ttl: float, maxsize: int = 256, max_stale: Optional[float] = None):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.max_stale = max(ttl, max_stale or ttl)
+        self._data: Dict[str, Tuple[float, Any]] = {}
+        self._kept: Set[str] = set()
+        self._lock = threading.Lock()
+        # Outcomes of lookup(): fresh hit, stale hit (served while refreshing) or miss
+        self.stats = {'hit': 0, 'stale': 0, 'miss': 0}
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value, or None if it is missing or expired"""
+        entry = self.get_entry(key)
+        if entry is None or time.time() - entry[0] >= self.ttl:
+            return None
+        return entry[1]
+
+    def get_entry(self, key: str) -> Optional[Tuple[float, Any]]:
+        """Return (stored_at, value) even if stale, or None once evicted"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and key not in self._kept and time.time() - entry[0] >= self.max_stale:
+                del self._data[key]
+                return None
+            return entry
+
+    def lookup(self, key: str) -> Optional[Tuple[float, Any]]:
+        """get_entry for a caller about to use the value; counted in stats"""
+        entry = self.get_entry(key)
+        outcome = 'miss' if entry is None else 'hit' if time.time() - entry[0] < self.ttl else 'stale'
+        with self._lock:
+            self.stats[outcome] += 1
+        return entry
+
+    def age(self, key: str) -> Optional[float]:
+        """Seconds since the entry was stored, or None if there is none"""
+        entry = self.get_entry(key)
+        return None if entry is None else time.time() - entry[0]
+
+    def ages(self) -> Dict[str, float]:
+        """Seconds since each entry was stored, stale ones included"""
+        now = time.time()
+        with self._lock:
+            return {key: now - stored_at for key, (stored_at, _) in self._data.items()}
+
+    def set(self, key: str, value: Any, stored_at: Optional[float] = None, keep: bool = False) -> None:
+        """Store a value and evict expired or overflowing entries; keep exempts it from age eviction"""
+        with self._lock:
+            self._data[key] = (stored_at or time.time(), value)
+            if keep:
+                self._kept.add(key)
+            else:
+                self._kept.discard(key)
+            self._evict()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._kept.clear()
+
+    def _evict(self) -> None:
+        now = time.time()
+        for key in [k for k, (t, _) in self._data.items() if now - t >= self.max_stale and k not in self._kept]:
+            del self._data[key]
+        while len(self._data) > self.maxsize:
+            oldest = min(self._data, key=lambda k: self._data[k][0])
+            del self._data[oldest]
+            self._kept.discard(oldest)
+
+
+class LRUCache:
+    """Small thread-safe least-recently-used cache"""
+
+    def __init__(self, maxsize: int = 32):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Any, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hit': 0, 'miss': 0}
+
+    def get(self, key: Any) -> Optional[Any]:
+        with self._lock:
+            if key not in self._data:
+                self.stats['miss'] += 1
+                return None
+            self.stats['hit'] += 1
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def set(self, key: Any, value: Any) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+
+class SingleFlight:
+    """Coalesces concurrent calls for the same key into one execution.
+
+    The first caller runs the function; everyone arriving while it runs waits
+    for that call and gets its result, or has its exception re-raised. Once the
+    call finishes the key is free again, so nothing is cached here.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, Future] = {}
+        self.stats = {'executed': 0, 'shared': 0}
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = Future()
+            self.stats['executed' if leader else 'shared'] += 1
+        if not leader:
+            return call.result()
+        try:
+            call.set_result(fn())
+        except BaseException as e:
+            call.set_exception(e)
+        finally:
+            with self._lock:
+                del self._calls[key]
+        return call.result()
+
+
+class _Span:
+    __slots__ = ('recorder', 'name', 'start')
+
+    def __init__(self, recorder: 'PerfRecorder', name: str):
+        self.recorder, self.name = recorder, name
+
+    def __enter__(self) -> None:
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc) -> None:
+        elapsed = time.perf_counter() - self.start
+        self.recorder._current[self.name] = self.recorder._current.get(self.name, 0.0) + elapsed
+
+
+class PerfRecorder:
+    """Wall-clock spans of one session's reruns, kept for a rolling window of runs.
+
+    While disabled, span() hands back a shared no-op context manager, so
+    instrumented code pays one attribute check per span. A span entered more
+    than once in a run accumulates.
+    """
+
+    _NOOP = nullcontext()
+
+    def __init__(self, window: int = 50):
+        self.enabled = False
+        self.latest: Dict[str, float] = {}
+        self._current: Dict[str, float] = {}
+        self._history: Dict[str, deque] = {}
+        self.window = window
+
+    def span(self, name: str):
+        return _Span(self, name) if self.enabled else self._NOOP
+
+    def start_run(self) -> None:
+        self._current = {}
+
+    def finish_run(self) -> None:
+        """Publish the spans of the run that just finished"""
+        if not self._current:
+            return
+        self.latest = self._current
+        for name, seconds in self.latest.items():
+            self._history.setdefault(name, deque(maxlen=self.window)).append(seconds)
+
+    def summary(self) -> pd.DataFrame:
+        """Latest, mean and p95 milliseconds per span, in the order spans were first seen"""
+        rows = []
+        for name, history in self._history.items():
+            values = np.fromiter(history, dtype=float) * 1e3
+            rows.append({'Span': name, 'Latest ms': self.latest.get(name, np.nan) * 1e3, 'Mean ms': values.mean(),
+                         'P95 ms': np.percentile(values, 95), 'Runs': len(values)})
+        return pd.DataFrame(rows, columns=['Span', 'Latest ms', 'Mean ms', 'P95 ms', 'Runs'])
+
+
+class MetricsRegistry:
+    """Process-wide counters and histograms rendered in the Prometheus text format.
+
+    Recording is a dict update under a lock; formatting only happens when the
+    endpoint is scraped. Collectors are called at scrape time for values that
+    already live elsewhere (cache counters, data ages) and return
+    (name, labels, value) samples of a family declared with describe().
+    """
+
     def __init__(self):
-        self.base_url = "https://api.coingecko.com/api/v3"
+        self._lock = threading.Lock()
+        self._families: Dict[str, Tuple[str, str]] = {}  # name -> (type, help)
+        self._buckets: Dict[str, Tuple[float, ...]] = {}
+        self._samples: Dict[str, Dict[Tuple[Tuple[str, str], ...], Any]] = {}
+        self._collectors: List[Callable[[], List[Tuple[str, Dict[str, str], float]]]] = []
+
+    def describe(self, name: str, kind: str, help_text: str, buckets: Optional[List[float]] = None) -> None:
+        """Declare a counter, gauge or histogram family"""
+        with self._lock:
+            self._families[name] = (kind, help_text)
+            self._samples.setdefault(name, {})
+            if kind == 'histogram':
+                self._buckets[name] = tuple(sorted(buckets or [0.1, 0.5, 1, 5, 10]))
+
+    def add_collector(self, collector: Callable[[], List[Tuple[str, Dict[str, str], float]]]) -> None:
+        with self._lock:
+            self._collectors.append(collector)
+
+    def inc(self, name: str, labels: Optional[Dict[str, str]] = None, amount: float = 1.0) -> None:
+        key = tuple(sorted((labels or {}).items()))
+        with self._lock:
+            samples = self._samples[name]
+            samples[key] = samples.get(key, 0.0) + amount
+
+    def observe(self, name: str, value: float, labels: Optional[Dict[str, str]] = None) -> None:
+        key = tuple(sorted((labels or {}).items()))
+        buckets = self._buckets[name]
+        with self._lock:
+            # [count per bucket..., sum, count]; buckets are made cumulative when rendered
+            state = self._samples[name].setdefault(key, [0] * len(buckets) + [0.0, 0])
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    def render(self) -> str:
+        """All families in the text exposition format (version 0.0.4)"""
+        with self._lock:
+            families = dict(self._families)
+            samples = {name: {k: list(v) if isinstance(v, list) else v for k, v in s.items()}
+                       for name, s in self._samples.items()}
+            collectors = list(self._collectors)
+        for collector in collectors:
+            try:
+                for name, labels, value in collector():
+                    samples[name][tuple(sorted(labels.items()))] = value
+            except Exception as e:
+                logger.warning("Metrics collector failed: %s", e)
+
+        lines = []
+        for name, (kind, help_text) in families.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for key, value in samples[name].items():
+                if kind != 'histogram':
+                    lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(self._buckets[name], value):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_format_labels(key + (('le', _format_value(bound)),))} {cumulative}")
+                lines.append(f"{name}_bucket{_format_labels(key + (('le', '+Inf'),))} {value[-1]}")
+                lines.append(f"{name}_sum{_format_labels(key)} {_format_value(value[-2])}")
+                lines.append(f"{name}_count{_format_labels(key)} {value[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    pairs = []
+    for key, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{key}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value != value:
+        return "NaN"
+    if value in (float('inf'), float('-inf')):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = self.server.registry.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+def serve_metrics(registry: MetricsRegistry, port: int, host: str = '127.0.0.1') -> ThreadingHTTPServer:
+    """Expose registry at http://host:port/metrics from a daemon thread"""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    server.registry = registry
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
+
+
+class BackgroundRefresher:
+    """Reloads cache entries off the request path, ahead of or at expiry.
+
+    Keys that nobody has asked for within idle_timeout seconds stop being
+    refreshed until they are requested again.
+    """
+
+    def __init__(self, cache: TTLCache, refresh_ahead: float = 0.9, interval: float = 60,
+                 idle_timeout: Optional[float] = None, name: str = "treasury-refresher"):
+        self.cache = cache
+        self.refresh_ahead = refresh_ahead  # fraction of the TTL after which we reload
+        self.interval = interval
+        self.idle_timeout = idle_timeout
+        self.name = name
+        self._loaders: Dict[str, Callable[[], Any]] = {}
+        self._last_used: Dict[str, float] = {}
+        self._inflight: Set[str] = set()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def register(self, key: str, loader: Callable[[], Any]) -> None:
+        """Keep key warm from now on, reloading it with loader"""
+        with self._lock:
+            self._loaders[key] = loader
+            self._last_used[key] = time.time()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def refresh_async(self, key: str) -> None:
+        """Start a reload of key unless one is already running"""
+        with self._lock:
+            loader = self._loaders.get(key)
+            if loader is None or key in self._inflight:
+                return
+            self._inflight.add(key)
+        threading.Thread(target=self._refresh, args=(key, loader), daemon=True).start()
+
+    def _refresh(self, key: str, loader: Callable[[], Any]) -> None:
+        try:
+            self.cache.set(key, loader())
+        except CircuitOpenError as e:
+            # Already reported when the circuit opened; the client probes for recovery
+            logger.debug("Background refresh of %s skipped: %s", key, e)
+        except Exception as e:
+            # Keep serving the previous value; the next sweep will retry
+            logger.warning("Background refresh of %s failed: %s", key, e)
+        finally:
+            with self._lock:
+                self._inflight.discard(key)
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            now = time.time()
+            with self._lock:
+                if self.idle_timeout is not None:
+                    for key in [k for k, t in self._last_used.items() if now - t > self.idle_timeout]:
+                        del self._loaders[key], self._last_used[key]
+                keys = list(self._loaders)
+            for key in keys:
+                age = self.cache.age(key)
+                if age is None or age >= self.cache.ttl * self.refresh_ahead:
+                    self.refresh_async(key)
+
+
+class SnapshotStore:
+    """SQLite store of the latest upstream snapshots, used for warm restarts and offline serving.
+
+    Each snapshot keeps the value the tracker serves and the raw upstream payload
+    when it differs. Processed frames are not stored: their Company IDs belong
+    to the process that built them, so they are rebuilt on demand. The manifest table
+    points at the newest snapshot per key so startup reads one row per key.
+    """
+
+    def __init__(self, path: str, retention_days: float = 7):
+        self.path = path
+        self.retention = retention_days * 86400
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS snapshots (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                key TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                value TEXT NOT NULL,
+                raw TEXT
+            );
+            CREATE INDEX IF NOT EXISTS snapshots_key_time ON snapshots (key, fetched_at);
+            CREATE TABLE IF NOT EXISTS manifest (
+                key TEXT PRIMARY KEY,
+                snapshot_id INTEGER NOT NULL,
+                fetched_at REAL NOT NULL
+            );
+        """)
+
+    def save(self, key: str, value: Any, raw: Any = None, fetched_at: Optional[float] = None) -> None:
+        """Append a snapshot, point the manifest at it and prune expired history"""
+        fetched_at = fetched_at or time.time()
+        row = (
+            key,
+            fetched_at,
+            json.dumps(value),
+            json.dumps(raw) if raw is not None else None,
+        )
+        with self._lock, self._conn:
+            cur = self._conn.execute(
+                "INSERT INTO snapshots (key, fetched_at, value, raw) VALUES (?, ?, ?, ?)", row
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO manifest (key, snapshot_id, fetched_at) VALUES (?, ?, ?)",
+                (key, cur.lastrowid, fetched_at),
+            )
+            self._conn.execute(
+                "DELETE FROM snapshots WHERE key = ? AND fetched_at < ? AND id != ?",
+                (key, fetched_at - self.retention, cur.lastrowid),
+            )
+
+    def touch(self, key: str, fetched_at: Optional[float] = None) -> bool:
+        """Mark the newest snapshot of key as still current, without rewriting it"""
+        fetched_at = fetched_at or time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT snapshot_id FROM manifest WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return False
+            self._conn.execute("UPDATE snapshots SET fetched_at = ? WHERE id = ?", (fetched_at, row[0]))
+            self._conn.execute("UPDATE manifest SET fetched_at = ? WHERE key = ?", (fetched_at, key))
+        return True
+
+    def load_latest(self, key: str) -> Optional[Tuple[float, Any]]:
+        """Return (fetched_at, value) of the newest snapshot for key"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT s.fetched_at, s.value FROM manifest m JOIN snapshots s ON s.id = m.snapshot_id "
+                "WHERE m.key = ?", (key,)
+            ).fetchone()
+        return None if row is None else (row[0], json.loads(row[1]))
+
+    def load_all_latest(self) -> Dict[str, Tuple[float, Any]]:
+        """Newest (fetched_at, value) for every key in the manifest"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT m.key, s.fetched_at, s.value FROM manifest m JOIN snapshots s ON s.id = m.snapshot_id"
+            ).fetchall()
+        return {key: (fetched_at, json.loads(value)) for key, fetched_at, value in rows}
+
+
+class HoldingsHistory:
+    """Append-only history of company holdings, indexed for range and as-of queries.
+
+    Rows are keyed by (company, symbol, coin, fetched_at), so companies sharing a
+    name stay apart and the holdings of one company over a date range are a
+    single index range scan. A per-coin snapshot table
+    resolves "all companies at date D" to one snapshot timestamp, which is then
+    read through the (coin, fetched_at) index.
+    """
+
+    columns = ['Name', 'Symbol', 'Country', 'Total Holdings', 'Entry Value', 'Current Value']
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS holdings (
+                company TEXT NOT NULL,
+                symbol TEXT NOT NULL,
+                coin TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                country TEXT,
+                total_holdings REAL,
+                entry_value REAL,
+                current_value REAL,
+                PRIMARY KEY (company, symbol, coin, fetched_at)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS holdings_coin_time ON holdings (coin, fetched_at);
+            CREATE TABLE IF NOT EXISTS history_snapshots (
+                coin TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                digest TEXT NOT NULL,
+                PRIMARY KEY (coin, fetched_at)
+            ) WITHOUT ROWID;
+        """)
+
+    def append(self, coin_id: str, df: pd.DataFrame, digest: str, fetched_at: Optional[float] = None) -> bool:
+        """Append a processed snapshot; returns False if it repeats the previous one"""
+        fetched_at = fetched_at or time.time()
+        with self._lock, self._conn:
+            last = self._conn.execute(
+                "SELECT digest FROM history_snapshots WHERE coin = ? ORDER BY fetched_at DESC LIMIT 1", (coin_id,)
+            ).fetchone()
+            if last is not None and last[0] == digest:
+                return False
+            self._conn.execute(
+                "INSERT OR REPLACE INTO history_snapshots (coin, fetched_at, digest) VALUES (?, ?, ?)",
+                (coin_id, fetched_at, digest),
+            )
+            rows = self._merge_listings(df).itertuples(index=False, name=None) if not df.empty else []
+            # Plain INSERT: a key collision is a bug and must abort the snapshot, not overwrite a row
+            self._conn.executemany(
+                "INSERT INTO holdings (company, symbol, country, total_holdings, entry_value, "
+                "current_value, coin, fetched_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (row + (coin_id, fetched_at) for row in rows),
+            )
+        return True
+
+    def _merge_listings(self, df: pd.DataFrame) -> pd.DataFrame:
+        """One row per (Name, Symbol); duplicate listings are summed"""
+        if not df.duplicated(['Name', 'Symbol']).any():
+            return df[self.columns]
+        values = ['Total Holdings', 'Entry Value', 'Current Value']
+        merged = df.groupby(['Name', 'Symbol'], sort=False).agg(
+            {'Country': 'first', **{column: 'sum' for column in values}})
+        return merged.reset_index()[self.columns]
+
+    def holdings_between(self, company: str, symbol: str, start: float, end: float,
+                         coin_id: Optional[str] = None) -> pd.DataFrame:
+        """Holdings of one company (name and ticker) between two timestamps, oldest first"""
+        clauses = ["company = ?", "symbol = ?"]
+        params: List[Any] = [company, symbol]
+        if coin_id:
+            clauses.append("coin = ?")
+            params.append(coin_id)
+        clauses.append("fetched_at BETWEEN ? AND ?")
+        params += [start, end]
+        return self._query(
+            "SELECT coin, fetched_at, total_holdings, entry_value, current_value FROM holdings "
+            f"WHERE {' AND '.join(clauses)} ORDER BY fetched_at", params
+        )
+
+    def companies_at(self, coin_id: str, when: float) -> pd.DataFrame:
+        """All companies as of the newest snapshot taken at or before when"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MAX(fetched_at) FROM history_snapshots WHERE coin = ? AND fetched_at <= ?", (coin_id, when)
+            ).fetchone()
+        if row is None or row[0] is None:
+            return pd.DataFrame()
+        return self._query(
+            "SELECT company, symbol, country, fetched_at, total_holdings, entry_value, current_value FROM holdings "
+            "WHERE coin = ? AND fetched_at = ? ORDER BY total_holdings DESC",
+            [coin_id, row[0]],
+        )
+
+    def frame_at(self, coin_id: str, when: float) -> pd.DataFrame:
+        """companies_at() with the column names used by process_treasury_data"""
+        return self.companies_at(coin_id, when).rename(columns={
+            'company': 'Name', 'symbol': 'Symbol', 'country': 'Country', 'total_holdings': 'Total Holdings',
+            'entry_value': 'Entry Value', 'current_value': 'Current Value',
+        })
+
+    def snapshot_times(self, coin_id: str) -> List[float]:
+        """Timestamps of every stored snapshot for a coin, oldest first"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT fetched_at FROM history_snapshots WHERE coin = ? ORDER BY fetched_at", (coin_id,)
+            ).fetchall()
+        return [r[0] for r in rows]
+
+    def _query(self, sql: str, params: List[Any]) -> pd.DataFrame:
+        with self._lock:
+            df = pd.read_sql_query(sql, self._conn, params=params)
+        if 'fetched_at' in df.columns:
+            df['fetched_at'] = pd.to_datetime(df['fetched_at'], unit='s', utc=True)
+        return df
+
+
+class UpstreamError(Exception):
+    """Raised when an upstream API answers with a non-200 status"""
+
+
+class CircuitOpenError(UpstreamError):
+    """Raised instead of calling an endpoint whose circuit breaker is open"""
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilling at rate tokens per second, up to capacity"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout: Optional[float] = None) -> float:
+        """Take a token, sleeping until one is free; returns the seconds waited.
+
+        Raises TimeoutError instead of waiting longer than timeout.
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                wait = (1 - self._tokens) / self.rate
+            if timeout is not None and waited + wait > timeout:
+                raise TimeoutError(f"No request budget within {timeout:.1f}s")
+            time.sleep(wait)
+            waited += wait
+
+    def pause(self, seconds: float) -> None:
+        """Hand out no tokens for the next seconds, e.g. after a 429 with Retry-After"""
+        with self._lock:
+            # Refill up to now first, or the next acquire would credit the idle time before the pause
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens = min(self._tokens, -seconds * self.rate)
+
+
+class CircuitBreaker:
+    """Opens after failure_threshold consecutive failed calls to one endpoint.
+
+    While open, callers fail fast instead of waiting on timeouts. The breaker
+    does not half-open on a user request: the owner probes the endpoint every
+    reset_timeout seconds off the request path and closes it on success.
+    """
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self) -> bool:
+        """Count a failure; returns True if this one opened the circuit"""
+        with self._lock:
+            self.failures += 1
+            if self.opened_at is None and self.failures >= self.failure_threshold:
+                self.opened_at = time.time()
+                return True
+            return False
+
+
+class HttpClient:
+    """GET with a client-side rate limit, bounded timeouts and retries.
+
+    Every request first takes a token from the bucket, which is shared by all
+    callers of the client, background refreshes included. Connection errors,
+    timeouts, 429 and 5xx answers are retried with exponential backoff and full
+    jitter, or after the server's Retry-After, while the wait still fits in the
+    deadline. Other responses are returned to the caller as they are.
+
+    Each endpoint has a circuit breaker: calls that still fail after their
+    retries count towards opening it, and while it is open a background thread
+    replays the failed request until the endpoint answers again.
+    """
+
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+    def __init__(self, session: Optional[requests.Session] = None, rate_per_minute: Optional[float] = None,
+                 burst: Optional[float] = None, timeout: Tuple[float, float] = (5, 20), max_retries: int = 3,
+                 backoff: float = 0.5, max_backoff: float = 30, deadline: float = 60,
+                 metrics: Optional[MetricsRegistry] = None):
+        self.session = session or requests.Session()
+        # (url, params) -> (etag, last_modified, body digest, parsed payload) of the last 200
+        self._validated = LRUCache(maxsize=64)
+        self.bucket = (TokenBucket(rate_per_minute / 60, burst or min(rate_per_minute, 10))
+                       if rate_per_minute else None)
+        self.timeout = timeout  # (connect, read) seconds
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.deadline = deadline
+        self.metrics = metrics
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def get(self, url: str, endpoint: str, params: Optional[Dict[str, Any]] = None,
+            headers: Optional[Dict[str, str]] = None) -> requests.Response:
+        breaker = self.breaker(endpoint)
+        if breaker.is_open:
+            raise CircuitOpenError(f"{endpoint} is unavailable; retrying in the background")
+        try:
+            response = self._get_with_retries(url, endpoint, params, headers)
+        except (requests.ConnectionError, requests.Timeout):
+            self._record_failure(breaker, url, endpoint, params)
+            raise
+        if response.status_code in self.RETRY_STATUSES:
+            self._record_failure(breaker, url, endpoint, params)
+        else:
+            breaker.record_success()
+        return response
+
+    def breaker(self, endpoint: str) -> CircuitBreaker:
+        with self._lock:
+            return self._breakers.setdefault(endpoint, CircuitBreaker())
+
+    def breakers(self) -> Dict[str, CircuitBreaker]:
+        with self._lock:
+            return dict(self._breakers)
+
+    def open_circuits(self) -> Dict[str, float]:
+        """Endpoints whose circuit is open, with the time it opened"""
+        return {endpoint: b.opened_at for endpoint, b in self.breakers().items() if b.opened_at is not None}
+
+    def _record_failure(self, breaker: CircuitBreaker, url: str, endpoint: str,
+                        params: Optional[Dict[str, Any]]) -> None:
+        if breaker.record_failure():
+            logger.warning("Circuit for %s opened after %d failures", endpoint, breaker.failures)
+            threading.Thread(target=self._probe, args=(breaker, url, endpoint, params),
+                             name=f"probe-{endpoint}", daemon=True).start()
+
+    def _probe(self, breaker: CircuitBreaker, url: str, endpoint: str, params: Optional[Dict[str, Any]]) -> None:
+        while breaker.is_open:
+            time.sleep(breaker.reset_timeout)
+            try:
+                if self.bucket is not None:
+                    self.bucket.acquire()
+                healthy = self._attempt(url, endpoint, params, None).status_code not in self.RETRY_STATUSES
+            except Exception:
+                healthy = False
+            if healthy:
+                logger.info("Circuit for %s closed, endpoint recovered", endpoint)
+                breaker.record_success()
+
+    def _get_with_retries(self, url: str, endpoint: str, params: Optional[Dict[str, Any]],
+                          headers: Optional[Dict[str, str]]) -> requests.Response:
+        start = time.monotonic()
+        for attempt in range(self.max_retries + 1):
+            remaining = self.deadline - (time.monotonic() - start)
+            if self.bucket is not None:
+                self._record('treasury_rate_limit_wait_seconds_total', endpoint,
+                             amount=self.bucket.acquire(timeout=remaining))
+            try:
+                response = self._attempt(url, endpoint, params, headers)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                response, error = None, e
+            else:
+                if response.status_code not in self.RETRY_STATUSES:
+                    return response
+                error = None
+
+            delay = self._retry_after(response)
+            if delay is None:
+                delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+            elif self.bucket is not None:
+                # The server told us when to come back; hold every other caller too
+                self.bucket.pause(delay)
+            if attempt == self.max_retries or time.monotonic() - start + delay > self.deadline:
+                if error is not None:
+                    raise error
+                return response
+            logger.info("Retrying %s in %.1fs (%s)", endpoint, delay,
+                        error or f"HTTP {response.status_code}")
+            self._record('treasury_upstream_retries_total', endpoint)
+            time.sleep(delay)
+
+    def get_json(self, url: str, endpoint: str, params: Optional[Dict[str, Any]] = None) -> Tuple[Any, bool]:
+        """Parsed JSON body of a 200, and whether it changed since the last call for this URL.
+
+        Revalidates with If-None-Match / If-Modified-Since when the previous
+        response carried an ETag or Last-Modified, and hands back the previously
+        parsed object on a 304. Without validators, a body whose hash matches the
+        previous one is not parsed again either. Raises UpstreamError otherwise.
+        """
+        key = (url, tuple(sorted((params or {}).items())))
+        previous = self._validated.get(key)
+        headers = {}
+        if previous is not None:
+            etag, last_modified = previous[:2]
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
+        response = self.get(url, endpoint, params, headers=headers)
+        if response.status_code == 304 and previous is not None:
+            self._validated.set(key, previous)
+            return previous[3], False
+        if response.status_code != 200:
+            raise UpstreamError(f"API Error: {response.status_code} - {response.text}")
+        digest = hashlib.sha256(response.content).hexdigest()
+        changed = previous is None or previous[2] != digest
+        payload = response.json() if changed else previous[3]
+        self._validated.set(key, (response.headers.get('ETag'), response.headers.get('Last-Modified'), digest, payload))
+        return payload, changed
+
+    def body_digest(self, url: str, params: Optional[Dict[str, Any]] = None) -> Optional[str]:
+        """sha256 of the last 200 body get_json received for this URL, if still known"""
+        previous = self._validated.get((url, tuple(sorted((params or {}).items()))))
+        return None if previous is None else previous[2]
+
+    def clear(self) -> None:
+        """Forget stored validators, so the next requests download full bodies"""
+        self._validated = LRUCache(maxsize=self._validated.maxsize)
+
+    def _attempt(self, url: str, endpoint: str, params: Optional[Dict[str, Any]],
+                 headers: Optional[Dict[str, str]]) -> requests.Response:
+        started = time.perf_counter()
+        status = 'error'
+        try:
+            response = self.session.get(url, params=params, headers=headers, timeout=self.timeout)
+            status = str(response.status_code)
+            return response
+        finally:
+            if self.metrics is not None:
+                self.metrics.observe('treasury_upstream_request_seconds', time.perf_counter() - started,
+                                     {'endpoint': endpoint})
+                self.metrics.inc('treasury_upstream_responses_total', {'endpoint': endpoint, 'status': status})
+
+    def _record(self, name: str, endpoint: str, amount: float = 1.0) -> None:
+        if self.metrics is not None and amount:
+            self.metrics.inc(name, {'endpoint': endpoint}, amount)
+
+    @staticmethod
+    def _retry_after(response: Optional[requests.Response]) -> Optional[float]:
+        """Seconds to wait from a Retry-After header given in seconds or as an HTTP date"""
+        value = response.headers.get('Retry-After') if response is not None else None
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+        except (TypeError, ValueError):
+            return None
+
+
+class FxProvider:
+    """USD based fiat rates, taken from the first of several sources that answers.
+
+    Sources are (name, loader) pairs tried in order; each loader returns
+    {currency: units per USD} and does its own caching. A source that fails or
+    has no rate besides USD moves on to the next one.
+    """
+
+    def __init__(self, sources: List[Tuple[str, Callable[[], Dict[str, float]]]]):
+        self.sources = sources
+        self.source: Optional[str] = None  # name of the source behind the latest rates
+
+    def usd_rates(self) -> Dict[str, float]:
+        errors = []
+        for name, loader in self.sources:
+            try:
+                rates = loader()
+            except Exception as e:
+                errors.append(f"{name}: {e}")
+                continue
+            if len(rates) > 1:
+                if self.source not in (None, name):
+                    logger.info("FX rates now come from %s", name)
+                self.source = name
+                return rates
+            errors.append(f"{name}: no fiat rates")
+        raise UpstreamError("No FX source available (" + "; ".join(errors) + ")")
+
+
+class TreasuryTracker:
+    def __init__(self, base_url: Optional[str] = None, fx_url: Optional[str] = None):
+        # Both endpoints can point at a local stand-in (see fake_coingecko.py)
+        self.base_url = (base_url or os.getenv('COINGECKO_BASE_URL') or "https://api.coingecko.com/api/v3").rstrip('/')
+        self.fx_url = fx_url or os.getenv('FX_API_URL') or "https://open.er-api.com/v6/latest/USD"
         self.api_key = os.getenv('COINGECKO_API_KEY')
         self.session = requests.Session()
         if self.api_key:
             self.session.headers.update({'X-CG-API-KEY': self.api_key})
         
-        # Cache data
-        self.cache = {}
+        # Offline mode serves saved snapshots only and never calls upstream
+        self.offline = os.getenv('TREASURY_OFFLINE', '').lower() in ('1', 'true', 'yes')
+        
+        # Cache data (shared across sessions, see get_tracker). Stale entries are
+        # served for up to a day while the refresher reloads them in the background.
         self.cache_timeout = 3600  # 1 hour
-        # FX rates cache (USD base)
-        self.fx_rates = {"USD": 1.0}
+        self.cache = TTLCache(self.cache_timeout, max_stale=float('inf') if self.offline else 24 * 3600)
+        # Keys nobody has asked for in two TTLs (charts no one views, the fallback FX API once
+        # CoinGecko answers again) drop out of the refresh sweep instead of polling forever
+        self.refresher = BackgroundRefresher(self.cache, idle_timeout=2 * self.cache_timeout)
+        # Spot prices move constantly, so they get their own short-lived cache that is
+        # only kept warm while someone is watching live values
+        self.spot_ttl = 15
+        self.spot_cache = TTLCache(self.spot_ttl, max_stale=3600)
+        self.spot_refresher = BackgroundRefresher(self.spot_cache, interval=5, idle_timeout=120,
+                                                  name="spot-price-refresher")
+        # Monte Carlo company chunks run in this many processes (0 keeps them in-process)
+        self.simulation_workers = int(os.getenv('SIMULATION_WORKERS', '0'))
+        # FX rates (USD base) are derived from CoinGecko's exchange_rates; the separate
+        # FX API is only called if that fails, unless FX_FALLBACK=0
+        fx_sources = [("CoinGecko", self._coingecko_fx_rates)]
+        if os.getenv('FX_FALLBACK', '1').lower() not in ('0', 'false', 'no'):
+            fx_sources.append((urlsplit(self.fx_url).netloc, self._fallback_fx_rates))
+        self.fx_provider = FxProvider(fx_sources)
+        # Stable integer ids for companies, shared by every coin and snapshot
+        self.company_index = CompanyIndex()
+        # Processed frames keyed by payload digest, plus payload digests keyed by identity.
+        # Fetched payloads use the hash of their response body; any other payload object
+        # gets a token of its own, so nothing is ever serialized again just to be hashed
+        self._processed = LRUCache(maxsize=32)
+        self._digests = LRUCache(maxsize=32)
+        self._payload_tokens = count()
+        self._breakevens = LRUCache(maxsize=32)
+        # Upstream loads in flight, shared by every caller of the same cache key
+        self._flights = SingleFlight()
+
+        # Prometheus metrics for upstream calls, caches and rendering (see serve_metrics)
+        self.metrics = MetricsRegistry()
+        self.metrics.describe('treasury_upstream_request_seconds', 'histogram',
+                              'Latency of upstream API requests by endpoint', UPSTREAM_LATENCY_BUCKETS)
+        self.metrics.describe('treasury_upstream_responses_total', 'counter',
+                              'Upstream API responses by endpoint and HTTP status ("error" when no response)')
+        self.metrics.describe('treasury_cache_lookups_total', 'counter', 'Cache lookups by cache and outcome')
+        self.metrics.describe('treasury_cache_hit_ratio', 'gauge', 'Share of cache lookups served from cache')
+        self.metrics.describe('treasury_upstream_loads_total', 'counter',
+                              'Cache loads by whether they ran or joined a load already in flight')
+        self.metrics.describe('treasury_circuit_open', 'gauge',
+                              '1 while the circuit breaker of an upstream endpoint is open')
+        self.metrics.describe('treasury_data_age_seconds', 'gauge', 'Age of the cached upstream data by cache key')
+        self.metrics.describe('treasury_render_seconds', 'histogram',
+                              'Time to render the dashboard views of one rerun', RENDER_BUCKETS)
+        self.metrics.describe('treasury_upstream_retries_total', 'counter', 'Upstream requests retried by endpoint')
+        self.metrics.describe('treasury_rate_limit_wait_seconds_total', 'counter',
+                              'Seconds spent waiting on the client-side rate limit by endpoint')
+        self.metrics.add_collector(self._collect_metrics)
+
+        # Every upstream call goes through a rate-limited, retrying client. The CoinGecko
+        # budget (calls per minute, 0 for none) is shared by sessions and refreshers;
+        # the FX host gets its own client so the API key is never sent there.
+        rate_limit = float(os.getenv('COINGECKO_RATE_LIMIT', '30'))
+        self.http = HttpClient(self.session, rate_per_minute=rate_limit or None, metrics=self.metrics)
+        self.fx_http = HttpClient(metrics=self.metrics)
+
+        # Persisted snapshots: warm the cache so a restart serves data immediately
+        snapshot_db = os.getenv('TREASURY_SNAPSHOT_DB', 'snapshots/treasury.db')
+        self.store = SnapshotStore(snapshot_db)
+        self.history = HoldingsHistory(snapshot_db)
+        # Snapshots keep their real age, however old; they stay until a refresh replaces them
+        for cache_key, (fetched_at, value) in self.store.load_all_latest().items():
+            self.cache.set(cache_key, value, stored_at=fetched_at, keep=True)
+
+    def _cached_fetch(self, cache_key: str, loader: Callable[[], Any], cache: Optional[TTLCache] = None,
+                      refresher: Optional[BackgroundRefresher] = None) -> Any:
+        """Stale-while-revalidate lookup: only a cold miss waits on upstream.
+
+        Uses the hourly cache and refresher unless another pair is given.
+        """
+        cache = cache or self.cache
+        refresher = refresher or self.refresher
+        entry = cache.lookup(cache_key)
+        if entry is None:
+            entry = cache.get_entry(cache_key) or self._cold_fetch(cache_key, loader, cache)
+        if not self.offline:
+            refresher.register(cache_key, functools.partial(self._flights.do, cache_key, loader))
+            if time.time() - entry[0] >= cache.ttl:
+                refresher.refresh_async(cache_key)
+        return entry[1]
+
+    def _cold_fetch(self, cache_key: str, loader: Callable[[], Any], cache: TTLCache) -> Tuple[float, Any]:
+        """Load a key missing from memory, falling back to the newest saved snapshot"""
+        if not self.offline:
+            try:
+                # Sessions missing the same key at once (or racing a background
+                # refresh of it) share a single upstream request
+                value = self._flights.do(cache_key, loader)
+                cache.set(cache_key, value)
+                return (time.time(), value)
+            except Exception as e:
+                snapshot = self.store.load_latest(cache_key)
+                if snapshot is None:
+                    raise
+                logger.warning("Serving saved snapshot of %s, upstream failed: %s", cache_key, e)
+        else:
+            snapshot = self.store.load_latest(cache_key)
+            if snapshot is None:
+                raise UpstreamError(f"Offline mode: no saved snapshot for {cache_key}")
+        # Kept past max_stale: otherwise an old snapshot is evicted at once and every
+        # rerun reads it from disk again and starts another cold fetch
+        cache.set(cache_key, snapshot[1], stored_at=snapshot[0], keep=True)
+        return snapshot
+
+    def _save_snapshot(self, cache_key: str, value: Any, raw: Any = None, changed: bool = True) -> None:
+        # A failing disk must never take the live data path down with it
+        try:
+            # An unchanged upstream answer only refreshes the saved snapshot's timestamp
+            if changed or not self.store.touch(cache_key):
+                self.store.save(cache_key, value, raw=raw)
+        except Exception as e:
+            logger.warning("Could not persist snapshot %s: %s", cache_key, e)
+
+    def _fetch_treasury(self, coin_id: str) -> Dict:
+        url = f"{self.base_url}/companies/public_treasury/{coin_id}"
+        data, changed = self.http.get_json(url, 'public_treasury')
+        self._remember_digest(data, self.http.body_digest(url))
+        if not changed:
+            self._save_snapshot(f"treasury_{coin_id}", data, changed=False)
+            return data
+        frame = self.process_treasury_data(data, coin_id)
+        self._save_snapshot(f"treasury_{coin_id}", data)
+        try:
+            self.history.append(coin_id, frame, self._payload_digest(data))
+        except Exception as e:
+            logger.warning("Could not record %s holdings history: %s", coin_id, e)
+        return data
+
+    def _fetch_exchange_rates(self) -> Dict:
+        url = f"{self.base_url}/exchange_rates"
+        payload, changed = self.http.get_json(url, 'exchange_rates')
+        rates = payload['rates']
+        self._save_snapshot("exchange_rates", rates, changed=changed)
+        return rates
+
+    def _coingecko_fx_rates(self) -> Dict[str, float]:
+        return usd_cross_rates(self.get_exchange_rates())
+
+    def _fallback_fx_rates(self) -> Dict[str, float]:
+        return self._cached_fetch("usd_fx_rates", self._fetch_usd_fx_rates)
+
+    def _fetch_usd_fx_rates(self) -> Dict[str, float]:
+        # Free, no-key USD base FX API
+        payload, changed = self.fx_http.get_json(self.fx_url, 'usd_fx_rates')
+        if payload.get("result") != "success" or "rates" not in payload:
+            raise UpstreamError("FX API returned no rates")
+        rates = payload["rates"]
+        # Currencies without a usable rate are left out (and shown in USD), never priced at 0
+        normalized = {"USD": 1.0}
+        for code in CURRENCY_SYMBOLS:
+            rate = float(rates.get(code) or 0)
+            if code != "USD" and rate > 0:
+                normalized[code] = rate
+        self._save_snapshot("usd_fx_rates", normalized, raw=payload, changed=changed)
+        return normalized
         
     def get_treasury_data(self, coin_id: str) -> Optional[Dict]:
         """Fetch treasury data for a specific coin from CoinGecko API"""
-        cache_key = f"treasury_{coin_id}"
-        
-        # Check cache first
-        if cache_key in self.cache:
-            cache_time, data = self.cache[cache_key]
-            if time.time() - cache_time < self.cache_timeout:
-                return data
-        
         try:
-            url = f"{self.base_url}/companies/public_treasury/{coin_id}"
-            response = self.session.get(url)
-            
-            if response.status_code == 200:
-                data = response.json()
-                # Cache the data
-                self.cache[cache_key] = (time.time(), data)
-                return data
-            else:
-                st.error(f"API Error: {response.status_code} - {response.text}")
-                return None
-                
+            return self._cached_fetch(f"treasury_{coin_id}", lambda: self._fetch_treasury(coin_id))
+        except UpstreamError as e:
+            st.error(str(e))
+            return None
         except Exception as e:
             st.error(f"Error fetching data: {str(e)}")
             return None
+
+    def get_treasury_age(self, coin_id: str) -> Optional[float]:
+        """Age in seconds of the treasury payload currently being served"""
+        return self.cache.age(f"treasury_{coin_id}")
+
+    def refresh(self, coin_ids: List[str]) -> None:
+        """Reload the data behind a view in the background; current copies keep being served"""
+        if self.offline:
+            return
+        for key in [f"treasury_{coin_id}" for coin_id in coin_ids] + ["exchange_rates", "usd_fx_rates"]:
+            self.refresher.refresh_async(key)
+        self.spot_refresher.refresh_async("spot_prices")
     
-    def get_exchange_rates(self) -> Dict:
-        """Get current exchange rates for currency conversion"""
-        cache_key = "exchange_rates"
-        
-        if cache_key in self.cache:
-            cache_time, data = self.cache[cache_key]
-            if time.time() - cache_time < self.cache_timeout:
-                return data
-        
+    def _fetch_spot_prices(self) -> Dict[str, float]:
+        url = f"{self.base_url}/simple/price"
+        payload, _ = self.http.get_json(url, 'simple_price', params={'ids': ','.join(COINS), 'vs_currencies': 'usd'})
+        return {coin_id: float(payload[coin_id]['usd']) for coin_id in COINS if coin_id in payload}
+
+    def get_spot_prices(self) -> Dict[str, float]:
+        """USD spot price of every registered coin from the small /simple/price endpoint"""
         try:
-            url = f"{self.base_url}/exchange_rates"
-            response = self.session.get(url)
-            
-            if response.status_code == 200:
-                rates = response.json()['rates']
-                self.cache[cache_key] = (time.time(), rates)
-                return rates
-            else:
-                return {'usd': {'value': 1.0}}
-                
-        except Exception as e:
-            return {'usd': {'value': 1.0}}
+            return self._cached_fetch("spot_prices", self._fetch_spot_prices, self.spot_cache, self.spot_refresher)
+        except Exception:
+            return {}
+
+    def get_spot_age(self) -> Optional[float]:
+        """Age in seconds of the spot prices currently being served"""
+        return self.spot_cache.age("spot_prices")
+
+    def _fetch_market_chart(self, coin_id: str, days: int) -> List[List[float]]:
+        url = f"{self.base_url}/coins/{coin_id}/market_chart"
+        payload, changed = self.http.get_json(url, 'market_chart',
+                                              params={'vs_currency': 'usd', 'days': days, 'interval': 'daily'})
+        prices = payload.get('prices', [])
+        self._save_snapshot(f"market_chart_{coin_id}_{days}", prices, changed=changed)
+        return prices
+
+    def get_price_history(self, coin_ids: List[str], days: int = 365) -> pd.DataFrame:
+        """Daily USD closes, one column per coin symbol; coins without history are left out"""
+        columns = {}
+        for coin_id in coin_ids:
+            try:
+                prices = self._cached_fetch(f"market_chart_{coin_id}_{days}",
+                                            lambda coin_id=coin_id: self._fetch_market_chart(coin_id, days))
+            except Exception as e:
+                logger.warning("No price history for %s: %s", coin_id, e)
+                continue
+            if prices:
+                points = np.asarray(prices, dtype=float)
+                days_index = pd.to_datetime(points[:, 0], unit='ms').normalize()
+                closes = pd.Series(points[:, 1], index=days_index)
+                # The latest point of the current day is intraday; keep the last one per day
+                columns[COINS[coin_id]['symbol']] = closes[~closes.index.duplicated(keep='last')]
+        return pd.DataFrame(columns).dropna()
+
+    def holdings_frame(self, data: Dict, coin_id: str, spot_price: Optional[float] = None) -> pd.DataFrame:
+        """Processed holdings, revalued at spot_price when one is given"""
+        df = self.process_treasury_data(data, coin_id)
+        if spot_price and not df.empty:
+            df = revalue_holdings(df, spot_price)
+        return df
+    
+    def get_exchange_rates(self) -> Dict:
+        """Get CoinGecko's BTC exchange rates; errors propagate so the FX provider can fall back"""
+        return self._cached_fetch("exchange_rates", self._fetch_exchange_rates)
 
     def get_usd_fx_rates(self) -> Dict[str, float]:
-        """Fetch USD base fiat FX rates for common currencies.
-        Falls back to 1.0 for USD if API is unavailable.
+        """Fetch USD base fiat FX rates for common currencies (see FxProvider).
+        Without live or saved rates only USD is returned; the fallback is not
+        cached, so the next call tries upstream again. Nothing is kept on the
+        shared tracker: callers pass the returned rates on to the formatters.
         """
-        cache_key = "usd_fx_rates"
-        if cache_key in self.cache:
-            cache_time, data = self.cache[cache_key]
-            if time.time() - cache_time < self.cache_timeout:
-                self.fx_rates = data
-                return data
         try:
-            # Free, no-key USD base FX API
-            resp = requests.get("https://open.er-api.com/v6/latest/USD", timeout=10)
-            if resp.status_code == 200:
-                payload = resp.json()
-                if payload.get("result") == "success" and "rates" in payload:
-                    rates = payload["rates"]
-                    normalized = {
-                        "USD": 1.0,
-                        "EUR": float(rates.get("EUR", 0)),
-                        "GBP": float(rates.get("GBP", 0)),
-                        "JPY": float(rates.get("JPY", 0)),
-                        "CAD": float(rates.get("CAD", 0)),
-                        "AUD": float(rates.get("AUD", 0)),
-                    }
-                    # Ensure sane fallbacks
-                    for k in list(normalized.keys()):
-                        if not normalized[k]:
-                            normalized[k] = 1.0 if k == "USD" else 0.0
-                    self.cache[cache_key] = (time.time(), normalized)
-                    self.fx_rates = normalized
-                    return normalized
-        except Exception:
-            pass
-        # Fallback
-        fallback = {"USD": 1.0, "EUR": 0.0, "GBP": 0.0, "JPY": 0.0, "CAD": 0.0, "AUD": 0.0}
-        self.fx_rates = fallback
-        self.cache[cache_key] = (time.time(), fallback)
-        return fallback
+            return self.fx_provider.usd_rates()
+        except Exception as e:
+            logger.warning("No FX rates available, showing USD only: %s", e)
+            return {"USD": 1.0}
+
+    def unavailable_sources(self) -> Dict[str, float]:
+        """Upstream hosts with an open circuit, mapped to when the first one opened"""
+        sources = {}
+        for url, client in ((self.base_url, self.http), (self.fx_url, self.fx_http)):
+            opened = client.open_circuits()
+            if opened:
+                sources[urlsplit(url).netloc] = min(opened.values())
+        return sources
     
+    def fetch_bundle(self, coin_ids: List[str]) -> Dict[str, Any]:
+        """Fetch FX rates and treasury data for several coins in parallel.
+
+        Returns {"fx_rates": {...}, "treasury": {coin_id: payload}} once every
+        request has finished, so a cold load costs the slowest call, not the sum.
+        """
+        ctx = get_script_run_ctx()
+
+        def run(fn, *args):
+            # Keep st.error output from worker threads attached to this session
+            add_script_run_ctx(threading.current_thread(), ctx)
+            return fn(*args)
+
+        with ThreadPoolExecutor(max_workers=len(coin_ids) + 1) as pool:
+            fx_future = pool.submit(run, self.get_usd_fx_rates)
+            treasury_futures = {coin_id: pool.submit(run, self.get_treasury_data, coin_id) for coin_id in coin_ids}
+            return {
+                "fx_rates": fx_future.result(),
+                "treasury": {coin_id: future.result() for coin_id, future in treasury_futures.items()},
+            }
+    
+    def _remember_digest(self, data: Any, digest: Optional[str]) -> None:
+        """Key data on digest (its response body hash) from now on"""
+        if digest is not None:
+            self._digests.set(id(data), (data, digest))
+
+    def _payload_digest(self, data: Any) -> str:
+        """Digest of a payload object the cache hands out: its body hash, or a token for this object"""
+        cached = self._digests.get(id(data))
+        if cached is not None and cached[0] is data:
+            return cached[1]
+        digest = f"payload-{next(self._payload_tokens)}"
+        self._digests.set(id(data), (data, digest))
+        return digest
+
     def process_treasury_data(self, data: Dict, coin_id: str) -> pd.DataFrame:
-        """Process raw treasury data into a clean DataFrame"""
-        if not data or 'companies' not in data:
+        """Process raw treasury data into a clean DataFrame.
+
+        Results are memoized on the payload's digest (the hash of the response
+        body it was parsed from) and the schema version, so reruns and repeat
+        calls with unchanged data skip processing.
+        """
+        if not data or not data.get('companies'):
             return pd.DataFrame()
         
-        companies = []
-        for company in data['companies']:
-            companies.append({
-                'Name': company.get('name', 'Unknown'),
-                'Symbol': company.get('symbol', 'N/A'),
-                'Country': company.get('country', 'Unknown'),
-                'Total Holdings': company.get('total_holdings', 0),
-                'Entry Value': company.get('total_entry_value_usd', 0),
-                'Current Value': company.get('total_current_value_usd', 0),
-                '% of Total Supply': company.get('percentage_of_total_supply', 0)
-            })
-        
-        df = pd.DataFrame(companies)
-        if not df.empty:
-            # Compute PnL per company
-            df['PnL'] = (df['Current Value'] - df['Entry Value']).fillna(0)
-            df['PnL %'] = df.apply(lambda r: ((r['PnL'] / r['Entry Value']) * 100) if r['Entry Value'] and r['Entry Value'] != 0 else 0, axis=1)
-            df = df.sort_values('Total Holdings', ascending=False)
+        key = (PROCESSED_SCHEMA_VERSION, coin_id, self._payload_digest(data))
+        df = self._processed.get(key)
+        if df is None:
+            df = self._process_treasury_data(data)
+            self._processed.set(key, df)
+        # Shallow copy so callers can add or rename columns without touching the memo
+        return df.copy(deep=False)
+
+    def breakeven_index(self, data: Dict, coin_id: str) -> BreakevenIndex:
+        """Breakeven index of a treasury payload, built once per payload content"""
+        key = (PROCESSED_SCHEMA_VERSION, coin_id, self._payload_digest(data))
+        index = self._breakevens.get(key)
+        if index is None:
+            index = BreakevenIndex(self.process_treasury_data(data, coin_id))
+            self._breakevens.set(key, index)
+        return index
+
+    def _process_treasury_data(self, data: Dict) -> pd.DataFrame:
+        # Build typed columns straight from the JSON records
+        raw = pd.DataFrame.from_records(data['companies'], columns=list(TREASURY_FIELDS))
+        columns = {}
+        for field, (column, default) in TREASURY_FIELDS.items():
+            values = raw[field]
+            if not isinstance(default, str) and not pd.api.types.is_float_dtype(values):
+                values = pd.to_numeric(values, errors='coerce').astype(float)
+            columns[column] = values.fillna(default)
         
-        return df
+        # Compute PnL per company (PnL % is 0 where there is no entry value)
+        entry = columns['Entry Value'].to_numpy()
+        pnl = columns['Current Value'].to_numpy() - entry
+        columns['PnL'] = pnl
+        columns['PnL %'] = np.divide(pnl * 100, entry, out=np.zeros_like(pnl), where=entry != 0)
+        columns['Company ID'] = self.company_index.ids_for(columns['Name'], columns['Symbol'], columns['Country'])
+        df = pd.DataFrame(columns)
+        return df.sort_values('Total Holdings', ascending=False)
     
-    def format_currency(self, value_usd: float, currency: str = 'USD') -> str:
-        """Format amounts (provided in USD) into selected fiat with suffixes."""
+    def cache_stats(self) -> pd.DataFrame:
+        """Hit and miss counts of the response caches and processing memos"""
+        caches = {
+            'Responses': self.cache,
+            'Spot prices': self.spot_cache,
+            'Processed frames': self._processed,
+            'Payload digests': self._digests,
+            'Breakeven indexes': self._breakevens,
+        }
+        rows = []
+        for name, cache in caches.items():
+            stats = dict(cache.stats)
+            hits = stats['hit'] + stats.get('stale', 0)
+            lookups = hits + stats['miss']
+            rows.append({'Cache': name, 'Hits': stats['hit'], 'Stale Hits': stats.get('stale', 0),
+                         'Misses': stats['miss'], 'Hit %': hits * 100 / lookups if lookups else np.nan})
+        return pd.DataFrame(rows)
+
+    def _collect_metrics(self) -> List[Tuple[str, Dict[str, str], float]]:
+        """Scrape-time samples of the cache counters and data ages"""
+        samples = []
+        for row in self.cache_stats().to_dict('records'):
+            cache = row['Cache']
+            for outcome, column in (('hit', 'Hits'), ('stale', 'Stale Hits'), ('miss', 'Misses')):
+                samples.append(('treasury_cache_lookups_total', {'cache': cache, 'outcome': outcome}, row[column]))
+            if not pd.isna(row['Hit %']):
+                samples.append(('treasury_cache_hit_ratio', {'cache': cache}, row['Hit %'] / 100))
+        for client in (self.http, self.fx_http):
+            for endpoint, breaker in client.breakers().items():
+                samples.append(('treasury_circuit_open', {'endpoint': endpoint}, float(breaker.is_open)))
+        for outcome, count in dict(self._flights.stats).items():
+            samples.append(('treasury_upstream_loads_total', {'outcome': outcome}, count))
+        for cache in (self.cache, self.spot_cache):
+            for key, age in cache.ages().items():
+                samples.append(('treasury_data_age_seconds', {'key': key}, age))
+        return samples
+
+    @staticmethod
+    def _display_rate(currency: str, fx_rates: Optional[Dict[str, float]]) -> Tuple[str, float]:
+        """Prefix and USD rate for currency; amounts without a rate stay in USD"""
+        rate = (fx_rates or {}).get(currency)
+        if rate is None:
+            return "$", 1.0
+        return CURRENCY_SYMBOLS.get(currency, "$"), rate
+
+    def format_currency(self, value_usd: float, currency: str = 'USD',
+                        fx_rates: Optional[Dict[str, float]] = None) -> str:
+        """Format amounts (provided in USD) into selected fiat with suffixes, using the given USD rates."""
+        prefix, rate = self._display_rate(currency, fx_rates)
         if pd.isna(value_usd) or value_usd == 0:
-            symbol_map = {"USD": "$", "EUR": "€", "GBP": "£", "JPY": "¥", "CAD": "C$", "AUD": "A$"}
-            return f"{symbol_map.get(currency, '$')}0"
-        rate = self.fx_rates.get(currency, 1.0)
+            return f"{prefix}0"
         converted = value_usd * rate
-        symbol_map = {"USD": "$", "EUR": "€", "GBP": "£", "JPY": "¥", "CAD": "C$", "AUD": "A$"}
-        prefix = symbol_map.get(currency, "$")
         abs_value = abs(converted)
         if abs_value >= 1e9:
             return f"{prefix}{converted/1e9:.2f}B"
@@ -195,6 +1780,27 @@ class TreasuryTracker:
             return f"{prefix}{converted/1e3:.2f}K"
         else:
             return f"{prefix}{converted:.2f}"
+
+    def format_currency_series(self, values_usd: pd.Series, currency: str = 'USD',
+                               fx_rates: Optional[Dict[str, float]] = None) -> pd.Series:
+        """format_currency for a whole column: one FX multiply, suffixes chosen by mask"""
+        prefix, rate = self._display_rate(currency, fx_rates)
+        values = pd.to_numeric(values_usd, errors='coerce').fillna(0).to_numpy(dtype=float)
+        converted = values * rate
+        magnitude = np.abs(converted)
+        thresholds = [magnitude >= 1e9, magnitude >= 1e6, magnitude >= 1e3]
+        scaled = (converted / np.select(thresholds, [1e9, 1e6, 1e3], default=1.0)).tolist()
+        suffixes = np.select(thresholds, ['B', 'M', 'K'], default='').tolist()
+        text = np.array([f"{prefix}{v:.2f}{suffix}" for v, suffix in zip(scaled, suffixes)], dtype=object)
+        text[values == 0] = f"{prefix}0"
+        return pd.Series(text, index=values_usd.index)
+    
+    def to_display_currency(self, df: pd.DataFrame, columns: List[str], currency: str,
+                            fx_rates: Dict[str, float]) -> pd.DataFrame:
+        """Copy of df with the USD columns converted to currency in a single multiply"""
+        display_df = df.copy()
+        display_df[columns] = df[columns].to_numpy(dtype=float) * self._display_rate(currency, fx_rates)[1]
+        return display_df
     
     def format_crypto_amount(self, amount: float, coin: str) -> str:
         """Format crypto amounts with proper precision"""
@@ -220,6 +1826,73 @@ class TreasuryTracker:
             unsafe_allow_html=True,
         )
 
+def currency_column(currency: str):
+    """Grid column showing a number with the currency symbol and thousands separators"""
+    return st.column_config.NumberColumn(format=f"{CURRENCY_SYMBOLS.get(currency, '$')}%,.0f")
+
+# Client-side formats for the non-currency columns of a processed treasury table
+HOLDINGS_COLUMN_CONFIG = {
+    'Total Holdings': st.column_config.NumberColumn(format="%,.0f"),
+    'PnL %': st.column_config.NumberColumn(format="%.2f%%"),
+    '% of Total Supply': st.column_config.NumberColumn(format="%.3f%%"),
+    'Company ID': None,
+}
+
+# What-if sliders span 0 to this multiple of today's price, sampled at this many points for the charts
+WHAT_IF_PRICE_RANGE = 3
+WHAT_IF_GRID_SIZE = 200
+
+# Percentiles of simulated total PnL kept for display
+MONTE_CARLO_PERCENTILES = [1, 5, 25, 50, 75, 95, 99]
+
+def format_age(seconds: float) -> str:
+    """Human readable age such as '42s', '12 min' or '3.5 h'"""
+    if seconds < 60:
+        return f"{seconds:.0f}s"
+    if seconds < 3600:
+        return f"{seconds / 60:.0f} min"
+    return f"{seconds / 3600:.1f} h"
+
+@st.cache_resource
+def get_tracker() -> TreasuryTracker:
+    """Return the process-wide tracker so its cache and HTTP session survive reruns"""
+    return TreasuryTracker()
+
+@st.cache_resource
+def start_metrics_server(_tracker: TreasuryTracker, port: int) -> Optional[ThreadingHTTPServer]:
+    """Serve the tracker's metrics on METRICS_PORT, once per process"""
+    try:
+        return serve_metrics(_tracker.metrics, port, os.getenv('METRICS_HOST', '127.0.0.1'))
+    except OSError as e:
+        logger.warning("Metrics endpoint not started on port %s: %s", port, e)
+        return None
+
+def get_perf() -> PerfRecorder:
+    """This session's span recorder; it only records while the debug panel is on (?debug=1)"""
+    if 'perf' not in st.session_state:
+        st.session_state['perf'] = PerfRecorder()
+    return st.session_state['perf']
+
+def timed(name: str):
+    """Decorator recording every call of a display function as one span"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with get_perf().span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def display_debug_panel(tracker, perf):
+    """Sidebar timings of this session's reruns and the shared cache counters"""
+    with st.sidebar.expander("⏱️ Performance", expanded=True):
+        st.caption(f"Spans of the last run, and mean / p95 over up to {perf.window} runs")
+        ms = st.column_config.NumberColumn(format="%.1f")
+        st.dataframe(perf.summary(), hide_index=True, use_container_width=True,
+                     column_config={'Latest ms': ms, 'Mean ms': ms, 'P95 ms': ms})
+        st.dataframe(tracker.cache_stats(), hide_index=True, use_container_width=True,
+                     column_config={'Hit %': st.column_config.NumberColumn(format="%.1f%%")})
+
 def main():
     st.markdown('<h1 class="main-header">💰 Crypto Treasury Tracker</h1>', unsafe_allow_html=True)
     st.markdown("""
@@ -231,16 +1904,24 @@ def main():
     </div>
     """, unsafe_allow_html=True)
     
-    # Initialize tracker
-    tracker = TreasuryTracker()
+    # Shared tracker (one per process, reused across sessions and reruns)
+    tracker = get_tracker()
+    if os.getenv('METRICS_PORT'):
+        start_metrics_server(tracker, int(os.getenv('METRICS_PORT')))
+    # Stage timings are only recorded while the hidden debug panel is open
+    perf = get_perf()
+    perf.enabled = st.query_params.get("debug") == "1"
+    perf.start_run()
     
     # Sidebar controls
     st.sidebar.header("🎛️ Controls")
     
-    # Asset selection
+    # Asset selection: one entry per registered coin, plus the combined view
+    asset_options = {f"{coin['name']} ({coin['symbol']})": [coin_id] for coin_id, coin in COINS.items()}
+    asset_options["All"] = list(COINS)
     selected_asset = st.sidebar.selectbox(
         "Select Asset",
-        ["Bitcoin (BTC)", "Ethereum (ETH)", "Both"],
+        list(asset_options),
         index=0
     )
     
@@ -260,43 +1941,93 @@ def main():
         index=0
     )
     
+    # Live mode revalues the cached holdings at spot prices every few seconds
+    live_prices = st.sidebar.toggle(
+        "⚡ Live prices",
+        value=False,
+        help="Revalue holdings at spot prices every few seconds. Treasury lists keep their hourly refresh."
+    )
+    
 
     
-    # Fetch data
+    coin_ids = asset_options[selected_asset]
+
+    # The cache is shared by every session, so only this view's entries are reloaded (in the background)
     if st.button("🔄 Refresh Data", type="primary"):
-        st.cache_data.clear()
-        st.rerun()
+        tracker.refresh(coin_ids)
+        st.toast("Refreshing in the background; new data shows up on the next update.")
     
-    # Load FX rates early so all views convert correctly
-    tracker.get_usd_fx_rates()
 
-    # Data loading
-    with st.spinner("Fetching treasury data..."):
-        btc_data = None
-        eth_data = None
-        
-        if selected_asset in ["Bitcoin (BTC)", "Both"]:
-            btc_data = tracker.get_treasury_data("bitcoin")
+    # Data loading (FX rates and every coin's treasury are fetched concurrently)
+    with st.spinner("Fetching treasury data..."), perf.span("fetch_bundle"):
+        bundle = tracker.fetch_bundle(coin_ids)
+        datasets = bundle["treasury"]
+        # Rates of this rerun; every formatter below uses these, never shared tracker state
+        fx_rates = bundle["fx_rates"]
+
+    # Stale snapshots are served instantly and refreshed in the background
+    ages = [age for age in (tracker.get_treasury_age(c) for c in coin_ids) if age is not None]
+    if tracker.offline:
+        st.info("Offline mode: serving the last saved snapshot.")
+    if ages:
+        st.caption(f"🕒 Treasury data updated {format_age(max(ages))} ago"
+                   + (" · ⚠️ stale" if max(ages) >= tracker.cache_timeout else "")
+                   + ("" if tracker.offline else " · refreshed automatically in the background"))
+    # Degraded upstreams fail fast; the last good data is served until a background probe succeeds
+    unavailable = tracker.unavailable_sources()
+    if unavailable:
+        down_for = format_age(time.time() - min(unavailable.values()))
+        st.warning(f"{', '.join(unavailable)} unavailable for {down_for}: showing the last good data"
+                   + (f" from {format_age(max(ages))} ago" if ages else "") + ". Recovery is checked in the background.")
+    if selected_currency not in bundle["fx_rates"]:
+        st.warning(f"No {selected_currency} exchange rate available right now; showing values in USD.")
+        selected_currency = "USD"
+    
+    def render_views():
+        started = time.perf_counter()
+        # Only spot prices are refetched here; holdings come from the cached treasury data
+        with perf.span("spot_prices"):
+            spot_prices = tracker.get_spot_prices() if live_prices else {}
+        if spot_prices:
+            prices = " · ".join(f"{COINS[c]['symbol']} ${spot_prices[c]:,.2f}" for c in coin_ids if c in spot_prices)
+            st.caption(f"⚡ Live prices: {prices} (updated {format_age(tracker.get_spot_age() or 0)} ago)")
         
-        if selected_asset in ["Ethereum (ETH)", "Both"]:
-            eth_data = tracker.get_treasury_data("ethereum")
+        # Display data
+        if len(coin_ids) == 1 and datasets[coin_ids[0]]:
+            display_coin_data(tracker, coin_ids[0], datasets[coin_ids[0]], selected_currency, fx_rates,
+                              spot_prices.get(coin_ids[0]))
+        elif len(coin_ids) > 1 and any(datasets.values()):
+            display_combined_data(tracker, datasets, selected_currency, fx_rates, spot_prices)
+        else:
+            st.warning("No data available. Please check your API key or try again later.")
+        tracker.metrics.observe('treasury_render_seconds', time.perf_counter() - started,
+                                {'view': 'combined' if len(coin_ids) > 1 else coin_ids[0]})
     
-    # Display data
-    if selected_asset == "Bitcoin (BTC)" and btc_data:
-        display_bitcoin_data(tracker, btc_data, selected_currency)
-    elif selected_asset == "Ethereum (ETH)" and eth_data:
-        display_ethereum_data(tracker, eth_data, selected_currency)
-    elif selected_asset == "Both" and (btc_data or eth_data):
-        display_combined_data(tracker, btc_data, eth_data, selected_currency)
-    else:
-        st.warning("No data available. Please check your API key or try again later.")
+    with perf.span("render_views"):
+        if live_prices:
+            st.fragment(render_views, run_every=tracker.spot_ttl)()
+        else:
+            render_views()
+    
+    perf.finish_run()
+    if perf.enabled:
+        display_debug_panel(tracker, perf)
     
     # Footer removed as requested
 
-def display_bitcoin_data(tracker, data, currency):
-    """Display Bitcoin treasury data"""
-    st.header("📊 Bitcoin Treasury Holdings")
+@timed("display_coin_data")
+def display_coin_data(tracker, coin_id, data, currency, fx_rates, spot_price=None):
+    """Display treasury data for a single coin from the registry, revalued at spot_price if given"""
+    coin = COINS[coin_id]
+    symbol = coin['symbol']
+    st.header(f"📊 {coin['name']} Treasury Holdings")
+    
+    # Process data
+    perf = get_perf()
+    with perf.span("display_coin_data.process"):
+        df = tracker.holdings_frame(data, coin_id, spot_price)
     
+    total_coins = 0
     # Overall stats
     if 'total_holdings' in data:
         col1, col2, col3, col4, col5 = st.columns(5)
@@ -304,206 +2035,352 @@ def display_bitcoin_data(tracker, data, currency):
         with col1:
             # Handle both dictionary and direct value formats
             if isinstance(data['total_holdings'], dict):
-                total_btc = data['total_holdings'].get('bitcoin', 0)
+                total_coins = data['total_holdings'].get(coin_id, 0)
             else:
-                total_btc = data['total_holdings']
-            tracker.render_metric("Total BTC Held", f"{total_btc:,.0f} BTC", "metric-green")
+                total_coins = data['total_holdings']
+            tracker.render_metric(f"Total {symbol} Held", f"{total_coins:,.0f} {symbol}", "metric-green")
         
         with col2:
-            total_value = data.get('total_value_usd', 0)
-            tracker.render_metric("Total Value", tracker.format_currency(total_value, currency), "metric-blue")
+            if spot_price and not df.empty:
+                total_value = float(df['Current Value'].sum())
+            else:
+                total_value = data.get('total_value_usd', 0)
+            tracker.render_metric("Total Value", tracker.format_currency(total_value, currency, fx_rates), "metric-blue")
         
         with col3:
             total_companies = len(data.get('companies', []))
-            avg_btc = (total_btc / total_companies) if total_companies else 0
-            tracker.render_metric("Avg BTC / Company", f"{avg_btc:,.0f}", "metric-orange")
+            avg_coins = (total_coins / total_companies) if total_companies else 0
+            tracker.render_metric(f"Avg {symbol} / Company", f"{avg_coins:,.0f}", "metric-orange")
         
         with col4:
             tracker.render_metric("Companies Tracked", f"{total_companies}", "metric-purple")
 
         with col5:
-            # Market cap dominance approximated as companies' share of BTC supply
+            # Market cap dominance approximated as companies' share of the coin supply
             dominance = 0.0
             try:
                 # Prefer API-provided percentages per company
                 companies = data.get('companies', [])
                 if companies:
                     dominance = sum([c.get('percentage_of_total_supply', 0) or 0 for c in companies])
-                elif total_btc:
-                    dominance = (total_btc / 21_000_000) * 100
+                elif total_coins and coin['max_supply']:
+                    dominance = (total_coins / coin['max_supply']) * 100
             except Exception:
                 dominance = 0.0
             tracker.render_metric("Market Cap Dominance", f"{dominance:.2f}%", "metric-teal")
     
-    # Process data
-    df = tracker.process_treasury_data(data, "bitcoin")
-    
     if not df.empty:
         # Display table
         st.subheader("🏢 Company Holdings")
         
-        # Format display columns
-        display_df = df.copy()
-        display_df['Total Holdings'] = display_df['Total Holdings'].apply(lambda x: f"{x:,.0f}")
-        display_df['Entry Value'] = display_df['Entry Value'].apply(lambda v: tracker.format_currency(v, currency))
-        display_df['Current Value'] = display_df['Current Value'].apply(lambda v: tracker.format_currency(v, currency))
-        display_df['PnL'] = display_df['PnL'].apply(lambda v: tracker.format_currency(v, currency))
-        display_df['PnL %'] = display_df['PnL %'].apply(lambda x: f"{x:.2f}%")
-        display_df['% of Total Supply'] = display_df['% of Total Supply'].apply(lambda x: f"{x:.3f}%")
-        
-        st.dataframe(display_df, use_container_width=True)
+        # Numbers stay numeric; the grid formats them client-side
+        with perf.span("display_coin_data.table"):
+            money_cols = ['Entry Value', 'Current Value', 'PnL']
+            display_df = tracker.to_display_currency(df, money_cols, currency, fx_rates)
+            column_config = {col: currency_column(currency) for col in money_cols}
+            column_config.update(HOLDINGS_COLUMN_CONFIG)
+            
+            st.dataframe(display_df, use_container_width=True, column_config=column_config)
 
         # Charts row
         chart_col1, chart_col2 = st.columns(2)
-        with chart_col1:
-            # Donut: Companies vs Others share of BTC supply
-            companies_share = (df['% of Total Supply'].sum()) if '% of Total Supply' in df.columns else (total_btc / 21_000_000 * 100 if total_btc else 0)
+        with chart_col1, perf.span("display_coin_data.charts"):
+            # Donut: Companies vs Others share of the coin supply
+            if '% of Total Supply' in df.columns:
+                companies_share = df['% of Total Supply'].sum()
+            elif total_coins and coin['max_supply']:
+                companies_share = total_coins / coin['max_supply'] * 100
+            else:
+                companies_share = 0
             companies_share = max(0.0, min(100.0, companies_share))
             others_share = 100 - companies_share
             pie_fig = px.pie(values=[companies_share, others_share], names=['Public Companies', 'Others'], hole=0.6,
-                              title='Share of BTC Supply (Companies vs Others)')
+                              title=f'Share of {symbol} Supply (Companies vs Others)')
             pie_fig.update_traces(textposition='inside', textinfo='percent+label')
             st.plotly_chart(pie_fig, use_container_width=True)
-        with chart_col2:
+        with chart_col2, perf.span("display_coin_data.charts"):
             # Top companies by current value
-            top_df = df.nlargest(10, 'Current Value')
-            bar_fig = px.bar(top_df, x='Name', y='Current Value', title='Top Public Companies Holding BTC')
+            top_df = display_df.nlargest(10, 'Current Value')
+            bar_fig = px.bar(top_df, x='Name', y='Current Value', title=f'Top Public Companies Holding {symbol}',
+                             text=tracker.format_currency_series(df.loc[top_df.index, 'Current Value'], currency, fx_rates))
             bar_fig.update_yaxes(title_text=f"Value ({currency})")
             st.plotly_chart(bar_fig, use_container_width=True)
 
-def display_ethereum_data(tracker, data, currency):
-    """Display Ethereum treasury data"""
-    st.header("📊 Ethereum Treasury Holdings")
-    
-    # Overall stats
-    if 'total_holdings' in data:
-        col1, col2, col3, col4, col5 = st.columns(5)
-        
-        with col1:
-            # Handle both dictionary and direct value formats
-            if isinstance(data['total_holdings'], dict):
-                total_eth = data['total_holdings'].get('ethereum', 0)
+        display_recent_acquisitions(tracker, coin_id, currency, fx_rates)
+        display_holdings_history(tracker, coin_id, df)
+        display_underwater(tracker, coin_id, data, df, currency, fx_rates)
+        holdings = combine_coin_frames({symbol: df}, tracker.company_index)
+        display_what_if(tracker, holdings, [symbol], currency, fx_rates)
+        display_monte_carlo(tracker, holdings, [symbol], currency, fx_rates)
+
+@timed("display_recent_acquisitions")
+def display_recent_acquisitions(tracker, coin_id, currency, fx_rates):
+    """Companies whose holdings grew between the two most recent recorded snapshots"""
+    times = tracker.history.snapshot_times(coin_id)
+    if len(times) < 2:
+        return
+    diff = diff_snapshots(tracker.history.frame_at(coin_id, times[-2]), tracker.history.frame_at(coin_id, times[-1]))
+    acquisitions = diff[diff['Holdings Change'] > 0].head(10)
+    if acquisitions.empty:
+        return
+    st.subheader("🛒 Recent Acquisitions")
+    st.caption(f"Changes since the snapshot of {datetime.fromtimestamp(times[-2]).strftime('%Y-%m-%d %H:%M')}")
+    display_df = tracker.to_display_currency(
+        acquisitions[['Name', 'Symbol', 'Change', 'Holdings Before', 'Holdings After', 'Holdings Change',
+                      'Entry Value Change']],
+        ['Entry Value Change'], currency, fx_rates,
+    )
+    column_config = {col: st.column_config.NumberColumn(format="%,.0f")
+                     for col in ['Holdings Before', 'Holdings After', 'Holdings Change']}
+    column_config['Entry Value Change'] = currency_column(currency)
+    st.dataframe(display_df, use_container_width=True, hide_index=True, column_config=column_config)
+
+@timed("display_holdings_history")
+def display_holdings_history(tracker, coin_id, df):
+    """Trend view of one company's holdings from the recorded snapshot history"""
+    if len(tracker.history.snapshot_times(coin_id)) < 2:
+        return
+    with st.expander("📈 Holdings History"):
+        listings = list(df[['Name', 'Symbol']].drop_duplicates().itertuples(index=False, name=None))
+        company, symbol = st.selectbox("Company", listings, format_func=lambda listing: f"{listing[0]} ({listing[1]})",
+                                       key=f"history_company_{coin_id}")
+        history_df = tracker.history.holdings_between(company, symbol, 0, time.time(), coin_id)
+        if history_df.empty:
+            st.info("No history recorded for this company yet.")
+            return
+        fig = px.line(history_df, x='fetched_at', y='total_holdings', markers=True,
+                      title=f"{company} ({symbol}) holdings over time")
+        fig.update_layout(xaxis_title="Date", yaxis_title="Holdings")
+        st.plotly_chart(fig, use_container_width=True)
+
+@timed("display_underwater")
+def display_underwater(tracker, coin_id, data, df, currency, fx_rates):
+    """Companies holding above their breakeven price now, and the share underwater at every price"""
+    index = tracker.breakeven_index(data, coin_id)
+    held = float(df['Total Holdings'].sum())
+    if not len(index) or held <= 0:
+        return
+    symbol = COINS[coin_id]['symbol']
+    # df may be revalued at spot, so its implied price is the live one
+    price = float(df['Current Value'].sum()) / held
+    now = index.underwater(price).iloc[0]
+    st.subheader("🌊 Underwater Companies")
+    u1, u2, u3, u4 = st.columns(4)
+    with u1:
+        tracker.render_metric("Underwater Now", f"{int(now['Underwater Companies'])} / {len(index)}", "metric-purple")
+    with u2:
+        tracker.render_metric("Underwater Value", tracker.format_currency(now['Underwater Value'], currency, fx_rates), "metric-blue")
+    with u3:
+        tracker.render_metric("Unrealized Loss", tracker.format_currency(now['Unrealized Loss'], currency, fx_rates), "metric-orange")
+    with u4:
+        median = index.price_for_underwater_share(0.5)
+        tracker.render_metric("Half Underwater Below", f"${median:,.0f}", "metric-teal")
+
+    curve = index.underwater(np.linspace(0, price * WHAT_IF_PRICE_RANGE, WHAT_IF_GRID_SIZE))
+    fig = px.line(curve, x='Price', y='Underwater %', title=f"Share of Companies Underwater by {symbol} Price",
+                  hover_data={'Underwater Companies': True})
+    fig.add_vline(x=price, line_dash='dash', annotation_text="Today")
+    fig.update_layout(xaxis_title=f"{symbol} price (USD)", yaxis_title="Underwater (%)")
+    st.plotly_chart(fig, use_container_width=True)
+
+def price_slider_range(price: float) -> Tuple[float, float]:
+    """Upper bound and a round step for a what-if price slider around today's price"""
+    upper = float(f"{price * WHAT_IF_PRICE_RANGE:.2g}")
+    step = float(10 ** np.floor(np.log10(upper / 1000)))
+    return upper, step
+
+@timed("display_what_if")
+def display_what_if(tracker, holdings, symbols, currency, fx_rates):
+    """Price sliders with per-company and aggregate PnL, plus a sensitivity chart over a price grid"""
+    engine = ScenarioEngine(holdings, symbols)
+    implied = engine.implied_prices()
+    symbols = [symbol for symbol in symbols if implied[symbol] > 0]
+    if not symbols:
+        return
+    st.subheader("🔮 What-If Analysis")
+    rate = fx_rates.get(currency, 1.0)
+
+    # Slider moves rerun only this section; holdings are not refetched or reprocessed
+    @st.fragment
+    def scenario():
+        prices, uppers = {}, {}
+        for col, symbol in zip(st.columns(len(symbols)), symbols):
+            key = f"what_if_{symbol}"
+            # Range and start value are fixed on first use: a changed slider resets, and live prices tick
+            if f"{key}_range" not in st.session_state:
+                upper, step = price_slider_range(implied[symbol])
+                st.session_state[f"{key}_range"] = (upper, step)
+                st.session_state[key] = min(upper, round(implied[symbol] / step) * step)
+            uppers[symbol], step = st.session_state[f"{key}_range"]
+            with col:
+                prices[symbol] = st.slider(f"{symbol} price (USD)", 0.0, uppers[symbol], step=step, key=key)
+
+        scenario_df = engine.company_pnl(prices)
+        scenario_pnl = float(scenario_df['Scenario PnL'].sum())
+        current_pnl = engine.total_pnl({})
+        m1, m2, m3, m4 = st.columns(4)
+        with m1:
+            tracker.render_metric("Scenario Value", tracker.format_currency(float(scenario_df['Scenario Value'].sum()), currency, fx_rates), "metric-blue")
+        with m2:
+            tracker.render_metric("Scenario PnL", tracker.format_currency(scenario_pnl, currency, fx_rates), "metric-orange")
+        with m3:
+            tracker.render_metric("PnL vs Today", tracker.format_currency(scenario_pnl - current_pnl, currency, fx_rates), "metric-orange")
+        with m4:
+            in_profit = int((scenario_df['Scenario PnL'] > 0).sum())
+            tracker.render_metric("Companies in Profit", f"{in_profit} / {len(scenario_df)}", "metric-purple")
+
+        chart_col, table_col = st.columns(2)
+        with chart_col:
+            if len(symbols) >= 2:
+                # Aggregate PnL over an x/y price grid, other coins at their slider price
+                x_symbol, y_symbol = symbols[:2]
+                x = np.linspace(0, uppers[x_symbol], WHAT_IF_GRID_SIZE)
+                y = np.linspace(0, uppers[y_symbol], WHAT_IF_GRID_SIZE)
+                grid = engine.pnl_grid(x_symbol, x, y_symbol, y, prices)
+                fig = go.Figure(go.Heatmap(x=x, y=y, z=grid * rate, zmid=0, colorscale='RdYlGn',
+                                           colorbar=dict(title=f"PnL ({currency})")))
+                fig.add_trace(go.Scatter(x=[prices[x_symbol]], y=[prices[y_symbol]], mode='markers',
+                                         marker=dict(color='white', size=12, symbol='x'), name='Scenario'))
+                fig.update_layout(title=f"Total PnL by {x_symbol} and {y_symbol} Price", height=500,
+                                  xaxis_title=f"{x_symbol} price (USD)", yaxis_title=f"{y_symbol} price (USD)")
             else:
-                total_eth = data['total_holdings']
-            tracker.render_metric("Total ETH Held", f"{total_eth:,.0f} ETH", "metric-green")
-        
-        with col2:
-            total_value = data.get('total_value_usd', 0)
-            tracker.render_metric("Total Value", tracker.format_currency(total_value, currency), "metric-blue")
-        
-        with col3:
-            total_companies = len(data.get('companies', []))
-            avg_eth = (total_eth / total_companies) if total_companies else 0
-            tracker.render_metric("Avg ETH / Company", f"{avg_eth:,.0f}", "metric-orange")
-        
-        with col4:
-            tracker.render_metric("Companies Tracked", f"{total_companies}", "metric-purple")
+                symbol = symbols[0]
+                x = np.linspace(0, uppers[symbol], WHAT_IF_GRID_SIZE)
+                fig = px.line(x=x, y=engine.pnl_grid(symbol, x) * rate, title=f"Total PnL by {symbol} Price")
+                fig.add_vline(x=prices[symbol], line_dash='dash')
+                fig.update_layout(height=500, xaxis_title=f"{symbol} price (USD)", yaxis_title=f"PnL ({currency})")
+            st.plotly_chart(fig, use_container_width=True)
+        with table_col:
+            money_cols = ['Scenario Value', 'Scenario PnL']
+            display_df = tracker.to_display_currency(scenario_df.sort_values('Scenario PnL', ascending=False), money_cols, currency, fx_rates)
+            column_config = {col: currency_column(currency) for col in money_cols}
+            column_config['Scenario PnL %'] = st.column_config.NumberColumn(format="%.2f%%")
+            st.dataframe(display_df, use_container_width=True, hide_index=True, height=500, column_config=column_config)
 
-        with col5:
-            # Market cap dominance for ETH = sum of company supply percentages
-            dominance = 0.0
-            try:
-                companies = data.get('companies', [])
-                if companies:
-                    dominance = sum([c.get('percentage_of_total_supply', 0) or 0 for c in companies])
-            except Exception:
-                dominance = 0.0
-            tracker.render_metric("Market Cap Dominance", f"{dominance:.2f}%", "metric-teal")
-    
-    # Process data
-    df = tracker.process_treasury_data(data, "ethereum")
-    
-    if not df.empty:
-        # Display table
-        st.subheader("🏢 Company Holdings")
-        
-        # Format display columns
-        display_df = df.copy()
-        display_df['Total Holdings'] = display_df['Total Holdings'].apply(lambda x: f"{x:,.0f}")
-        display_df['Entry Value'] = display_df['Entry Value'].apply(lambda v: tracker.format_currency(v, currency))
-        display_df['Current Value'] = display_df['Current Value'].apply(lambda v: tracker.format_currency(v, currency))
-        display_df['PnL'] = display_df['PnL'].apply(lambda v: tracker.format_currency(v, currency))
-        display_df['PnL %'] = display_df['PnL %'].apply(lambda x: f"{x:.2f}%")
-        display_df['% of Total Supply'] = display_df['% of Total Supply'].apply(lambda x: f"{x:.3f}%")
-        
-        st.dataframe(display_df, use_container_width=True)
+    scenario()
 
-        # Charts row
-        chart_col1, chart_col2 = st.columns(2)
-        with chart_col1:
-            # Donut: Companies vs Others share of ETH supply (from API percentages sum)
-            companies_share = df['% of Total Supply'].sum() if '% of Total Supply' in df.columns else 0
-            companies_share = max(0.0, min(100.0, companies_share))
-            others_share = 100 - companies_share
-            pie_fig = px.pie(values=[companies_share, others_share], names=['Public Companies', 'Others'], hole=0.6,
-                              title='Share of ETH Supply (Companies vs Others)')
-            pie_fig.update_traces(textposition='inside', textinfo='percent+label')
-            st.plotly_chart(pie_fig, use_container_width=True)
-        with chart_col2:
-            # Top companies by current value
-            top_df = df.nlargest(10, 'Current Value')
-            bar_fig = px.bar(top_df, x='Name', y='Current Value', title='Top Public Companies Holding ETH')
-            bar_fig.update_yaxes(title_text=f"Value ({currency})")
-            st.plotly_chart(bar_fig, use_container_width=True)
+def run_monte_carlo(tracker, engine, n_paths, horizon_days, confidence, historical_drift):
+    """Simulate, then keep only what the results view needs (USD amounts)"""
+    symbols = engine.symbols
+    history = tracker.get_price_history([coin_id for coin_id, coin in COINS.items() if coin['symbol'] in symbols])
+    drift, volatility, correlation = estimate_gbm_params(history, symbols)
+    if not historical_drift:
+        drift = np.zeros_like(drift)
+    simulator = MonteCarloSimulator(engine, drift, volatility, correlation)
+    prices = simulator.terminal_prices(n_paths, horizon_days)
+    pnl = simulator.aggregate_pnl(prices)
+    current = float(simulator.current_pnl().sum())
+    var, shortfall = simulator.value_at_risk(pnl, current, confidence)
+    counts, edges = np.histogram(pnl, bins=100)
+    return {
+        'n_paths': n_paths,
+        'horizon_days': horizon_days,
+        'confidence': confidence,
+        'estimated': [symbol for symbol in symbols if symbol in history.columns and len(history) > 30],
+        'volatility': dict(zip(symbols, volatility.tolist())),
+        'current': current,
+        'percentiles': dict(zip(MONTE_CARLO_PERCENTILES, np.percentile(pnl, MONTE_CARLO_PERCENTILES).tolist())),
+        'loss_probability': float((pnl < current).mean()),
+        'var': var,
+        'shortfall': shortfall,
+        'histogram': ((edges[:-1] + edges[1:]) / 2, counts),
+        'companies': simulator.company_risk(prices, confidence, tracker.simulation_workers),
+    }
 
-def display_combined_data(tracker, btc_data, eth_data, currency):
-    """Display combined Bitcoin and Ethereum data"""
-    st.header("📊 Combined Treasury Holdings")
-    
-    # Process both datasets
-    btc_df = tracker.process_treasury_data(btc_data, "bitcoin") if btc_data else pd.DataFrame()
-    eth_df = tracker.process_treasury_data(eth_data, "ethereum") if eth_data else pd.DataFrame()
-    
-    # Create combined view
-    if not btc_df.empty or not eth_df.empty:
-        # Normalize column names for merge
-        for df in [btc_df, eth_df]:
-            if not df.empty:
-                df.rename(columns={
-                    'Name': 'Company',
-                    'Total Holdings': 'Holdings',
-                    'Entry Value': 'EntryUSD',
-                    'Current Value': 'CurrentUSD'
-                }, inplace=True)
-        btc_df['Asset'] = 'BTC' if not btc_df.empty else 'BTC'
-        eth_df['Asset'] = 'ETH' if not eth_df.empty else 'ETH'
-
-        # Merge outer on company identity
-        combined_df = pd.merge(
-            btc_df[['Company','Symbol','Country','Holdings','EntryUSD','CurrentUSD']].rename(columns={
-                'Holdings':'BTC Held', 'EntryUSD':'EntryUSD_BTC', 'CurrentUSD':'CurrentUSD_BTC'
-            }) if not btc_df.empty else pd.DataFrame(columns=['Company','Symbol','Country','BTC Held','EntryUSD_BTC','CurrentUSD_BTC']),
-            eth_df[['Company','Symbol','Country','Holdings','EntryUSD','CurrentUSD']].rename(columns={
-                'Holdings':'ETH Held', 'EntryUSD':'EntryUSD_ETH', 'CurrentUSD':'CurrentUSD_ETH'
-            }) if not eth_df.empty else pd.DataFrame(columns=['Company','Symbol','Country','ETH Held','EntryUSD_ETH','CurrentUSD_ETH']),
-            on=['Company','Symbol','Country'], how='outer'
-        ).fillna(0)
-
-        # Totals (USD basis)
-        combined_df['Total Entry Value'] = combined_df.get('EntryUSD_BTC', 0) + combined_df.get('EntryUSD_ETH', 0)
-        combined_df['Total Current Value'] = combined_df.get('CurrentUSD_BTC', 0) + combined_df.get('CurrentUSD_ETH', 0)
-        combined_df['Total PnL'] = combined_df['Total Current Value'] - combined_df['Total Entry Value']
-
-        # Metrics row 1
+@timed("display_monte_carlo")
+def display_monte_carlo(tracker, holdings, symbols, currency, fx_rates):
+    """Simulated distribution of aggregate and per-company PnL under correlated GBM prices"""
+    engine = ScenarioEngine(holdings, symbols)
+    if not any(price > 0 for price in engine.implied_prices().values()):
+        return
+    state_key = f"monte_carlo_{'_'.join(symbols)}"
+    with st.expander("🎲 Monte Carlo Simulation"):
+        with st.form(f"{state_key}_form"):
+            c1, c2, c3 = st.columns(3)
+            n_paths = c1.select_slider("Paths", [1_000, 10_000, 100_000], value=10_000)
+            horizon_days = c2.slider("Horizon (days)", 1, 365, 30)
+            confidence = c3.selectbox("VaR confidence", [0.95, 0.99], format_func=lambda c: f"{c:.0%}")
+            historical_drift = st.checkbox(
+                "Use historical drift", value=False,
+                help="Otherwise prices drift by zero. Volatility and correlation come from the last year of daily prices when available."
+            )
+            if st.form_submit_button("Run simulation"):
+                with st.spinner("Simulating price paths..."):
+                    st.session_state[state_key] = run_monte_carlo(tracker, engine, n_paths, horizon_days,
+                                                                  confidence, historical_drift)
+        result = st.session_state.get(state_key)
+        if result is None:
+            return
+
+        volatility = " · ".join(f"{symbol} {vol:.0%}" for symbol, vol in result['volatility'].items())
+        source = "from the last year of daily prices" if result['estimated'] else "defaults, no price history available"
+        st.caption(f"{result['n_paths']:,} paths over {result['horizon_days']} days · annual volatility {volatility} ({source})")
+        confidence = result['confidence']
         m1, m2, m3, m4 = st.columns(4)
         with m1:
-            total_btc = combined_df['BTC Held'].sum() if 'BTC Held' in combined_df.columns else 0
-            tracker.render_metric("Total BTC Held", f"{total_btc:,.0f} BTC", "metric-green")
+            tracker.render_metric("Median PnL", tracker.format_currency(result['percentiles'][50], currency, fx_rates), "metric-blue")
         with m2:
-            total_eth = combined_df['ETH Held'].sum() if 'ETH Held' in combined_df.columns else 0
-            tracker.render_metric("Total ETH Held", f"{total_eth:,.0f} ETH", "metric-green")
+            tracker.render_metric(f"VaR {confidence:.0%}", tracker.format_currency(result['var'], currency, fx_rates), "metric-orange")
         with m3:
-            total_entry = float(combined_df['Total Entry Value'].sum())
-            tracker.render_metric("Total Entry Value", tracker.format_currency(total_entry, currency), "metric-blue")
+            tracker.render_metric("Expected Shortfall", tracker.format_currency(result['shortfall'], currency, fx_rates), "metric-orange")
         with m4:
+            tracker.render_metric("Chance PnL Falls", f"{result['loss_probability']:.1%}", "metric-purple")
+
+        st.caption("Total PnL percentiles: " + " · ".join(
+            f"P{q} {tracker.format_currency(value, currency, fx_rates)}" for q, value in result['percentiles'].items()))
+
+        rate = fx_rates.get(currency, 1.0)
+        centers, counts = result['histogram']
+        fig = px.bar(x=centers * rate, y=counts, title="Simulated Total PnL")
+        fig.add_vline(x=result['current'] * rate, line_dash='dash', annotation_text="Today")
+        fig.update_layout(xaxis_title=f"PnL ({currency})", yaxis_title="Paths", bargap=0)
+        st.plotly_chart(fig, use_container_width=True)
+
+        companies = result['companies'].sort_values(f'VaR {confidence:.0%}', ascending=False)
+        money_cols = [col for col in companies.columns if col not in ('Company', 'Symbol', 'Country')]
+        display_df = tracker.to_display_currency(companies, money_cols, currency, fx_rates)
+        st.dataframe(display_df, use_container_width=True, hide_index=True,
+                     column_config={col: currency_column(currency) for col in money_cols})
+
+@timed("display_combined_data")
+def display_combined_data(tracker, datasets, currency, fx_rates, spot_prices=None):
+    """Display the holdings of every coin in datasets ({coin_id: payload}) side by side"""
+    st.header("📊 Combined Treasury Holdings")
+    
+    # Process every dataset through the shared pipeline
+    perf = get_perf()
+    spot_prices = spot_prices or {}
+    with perf.span("display_combined_data.process"):
+        frames = {
+            COINS[coin_id]['symbol']: tracker.holdings_frame(data, coin_id, spot_prices.get(coin_id)) if data else pd.DataFrame()
+            for coin_id, data in datasets.items()
+        }
+    symbols = list(frames)
+    
+    # Create combined view
+    if any(not df.empty for df in frames.values()):
+        # Align all coins on their company ids (outer join, 0 where a coin is not held)
+        with perf.span("display_combined_data.merge"):
+            combined_df = combine_coin_frames(frames, tracker.company_index)
+
+        # Metrics row 1: holdings per coin, then total values
+        row1 = st.columns(len(symbols) + 2)
+        for col, symbol in zip(row1, symbols):
+            with col:
+                total_held = combined_df[f'{symbol} Held'].sum()
+                tracker.render_metric(f"Total {symbol} Held", f"{total_held:,.0f} {symbol}", "metric-green")
+        with row1[-2]:
+            total_entry = float(combined_df['Total Entry Value'].sum())
+            tracker.render_metric("Total Entry Value", tracker.format_currency(total_entry, currency, fx_rates), "metric-blue")
+        with row1[-1]:
             total_current = float(combined_df['Total Current Value'].sum())
-            tracker.render_metric("Total Current Value", tracker.format_currency(total_current, currency), "metric-blue")
+            tracker.render_metric("Total Current Value", tracker.format_currency(total_current, currency, fx_rates), "metric-blue")
 
         # Metrics row 2
         n1, n2, n3, n4 = st.columns(4)
         with n1:
             total_pnl = total_current - total_entry
-            tracker.render_metric("Total PnL", tracker.format_currency(total_pnl, currency), "metric-orange")
+            tracker.render_metric("Total PnL", tracker.format_currency(total_pnl, currency, fx_rates), "metric-orange")
         with n2:
             pnl_pct = (total_pnl / total_entry * 100) if total_entry > 0 else 0
             tracker.render_metric("Total PnL %", f"{pnl_pct:.2f}%", "metric-orange")
@@ -511,72 +2388,64 @@ def display_combined_data(tracker, btc_data, eth_data, currency):
             total_companies = len(combined_df)
             tracker.render_metric("Total Companies", f"{total_companies}", "metric-purple")
         with n4:
-            btc_companies = len(combined_df[combined_df['BTC Held'] > 0]) if 'BTC Held' in combined_df.columns else 0
-            eth_companies = len(combined_df[combined_df['ETH Held'] > 0]) if 'ETH Held' in combined_df.columns else 0
-            tracker.render_metric("BTC / ETH Companies", f"{btc_companies} / {eth_companies}", "metric-purple")
+            holder_counts = [str(int((combined_df[f'{symbol} Held'] > 0).sum())) for symbol in symbols]
+            tracker.render_metric(f"{' / '.join(symbols)} Companies", " / ".join(holder_counts), "metric-purple")
 
         # Display combined table
         st.subheader("🏢 Combined Company Holdings")
         
-        # Format display columns
-        display_df = combined_df.copy()
-        if 'BTC Held' in display_df.columns:
-            display_df['BTC Held'] = display_df['BTC Held'].apply(lambda x: tracker.format_crypto_amount(x, 'BTC'))
-        if 'ETH Held' in display_df.columns:
-            display_df['ETH Held'] = display_df['ETH Held'].apply(lambda x: tracker.format_crypto_amount(x, 'ETH'))
-        display_df['EntryUSD_BTC'] = display_df.get('EntryUSD_BTC', 0)
-        display_df['CurrentUSD_BTC'] = display_df.get('CurrentUSD_BTC', 0)
-        display_df['EntryUSD_ETH'] = display_df.get('EntryUSD_ETH', 0)
-        display_df['CurrentUSD_ETH'] = display_df.get('CurrentUSD_ETH', 0)
-        display_df['Total Entry Value'] = display_df['Total Entry Value']
-        display_df['Total Current Value'] = display_df['Total Current Value']
-        display_df['Total PnL'] = display_df['Total PnL']
-
         # Derive per-company combined PnL
+        display_df = combined_df.copy()
         display_df['Company PnL'] = (combined_df['Total Current Value'] - combined_df['Total Entry Value'])
-        display_df['Company PnL %'] = combined_df.apply(
-            lambda r: ((r['Total Current Value'] - r['Total Entry Value']) / r['Total Entry Value'] * 100) if r['Total Entry Value'] and r['Total Entry Value'] != 0 else 0,
-            axis=1,
+        total_entry_values = combined_df['Total Entry Value'].to_numpy(dtype=float)
+        display_df['Company PnL %'] = np.divide(
+            display_df['Company PnL'].to_numpy(dtype=float) * 100, total_entry_values,
+            out=np.zeros_like(total_entry_values), where=total_entry_values != 0,
         )
-        # Currency formatting for visible columns
-        for col in ['EntryUSD_BTC','CurrentUSD_BTC','EntryUSD_ETH','CurrentUSD_ETH','Total Entry Value','Total Current Value','Total PnL','Company PnL']:
-            display_df[col] = display_df[col].apply(lambda v: tracker.format_currency(v, currency))
-        display_df['Company PnL %'] = display_df['Company PnL %'].apply(lambda x: f"{x:.2f}%")
+        # Numbers stay numeric; currency conversion is one multiply over the money columns
+        coin_money_cols = [col for symbol in symbols for col in (f'EntryUSD_{symbol}', f'CurrentUSD_{symbol}')]
+        money_cols = coin_money_cols + ['Total Entry Value','Total Current Value','Total PnL','Company PnL']
+        display_df = tracker.to_display_currency(display_df, money_cols, currency, fx_rates)
+        column_config = {col: currency_column(currency) for col in money_cols}
+        column_config.update({f'{symbol} Held': st.column_config.NumberColumn(format=f"%,.0f {symbol}") for symbol in symbols})
+        column_config['Company PnL %'] = st.column_config.NumberColumn(format="%.2f%%")
         
-        # Order columns if present
-        preferred_cols = [
-            'Company','Symbol','Country','BTC Held','EntryUSD_BTC','CurrentUSD_BTC','ETH Held','EntryUSD_ETH','CurrentUSD_ETH','Total Entry Value','Total Current Value','Total PnL','Company PnL','Company PnL %'
-        ]
-        existing_cols = [c for c in preferred_cols if c in display_df.columns]
-        st.dataframe(display_df[existing_cols], use_container_width=True)
+        # Column order: identity, then per-coin holdings and values, then totals
+        ordered_cols = ['Company','Symbol','Country']
+        for symbol in symbols:
+            ordered_cols += [f'{symbol} Held', f'EntryUSD_{symbol}', f'CurrentUSD_{symbol}']
+        ordered_cols += ['Total Entry Value','Total Current Value','Total PnL','Company PnL','Company PnL %']
+        with perf.span("display_combined_data.table"):
+            st.dataframe(display_df[ordered_cols], use_container_width=True, column_config=column_config)
         
         # Charts
         col1, col2 = st.columns(2)
         
-        with col1:
+        with col1, perf.span("display_combined_data.charts"):
             # Top companies by total value (Company on x-axis)
-            top_10 = combined_df.nlargest(10, 'Total Current Value')
+            top_10 = display_df.nlargest(10, 'Total Current Value')
             fig = px.bar(
                 top_10,
                 x='Company',
                 y='Total Current Value',
+                text=tracker.format_currency_series(combined_df.loc[top_10.index, 'Total Current Value'], currency, fx_rates),
                 title="Top 10 Companies by Total Value"
             )
-            fig.update_layout(height=500, xaxis_tickangle=-45)
+            fig.update_layout(height=500, xaxis_tickangle=-45, yaxis_title=f"Value ({currency})")
             st.plotly_chart(fig, use_container_width=True)
         
-        with col2:
+        with col2, perf.span("display_combined_data.charts"):
             # Asset distribution pie chart
-            btc_total = combined_df['CurrentUSD_BTC'].sum() if 'CurrentUSD_BTC' in combined_df.columns else 0
-            eth_total = combined_df['CurrentUSD_ETH'].sum() if 'CurrentUSD_ETH' in combined_df.columns else 0
-            
             fig = px.pie(
-                values=[btc_total, eth_total],
-                names=['Bitcoin', 'Ethereum'],
+                values=[combined_df[f'CurrentUSD_{COINS[coin_id]["symbol"]}'].sum() for coin_id in datasets],
+                names=[COINS[coin_id]['name'] for coin_id in datasets],
                 title="Asset Distribution by Value"
             )
             fig.update_layout(height=500)
             st.plotly_chart(fig, use_container_width=True)
 
+        display_what_if(tracker, combined_df, symbols, currency, fx_rates)
+        display_monte_carlo(tracker, combined_df, symbols, currency, fx_rates)
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,248 @@
+"""Benchmarks for the treasury data pipeline, one stage at a time.
+
+Run with:
+    python benchmarks.py
+    python benchmarks.py --sizes 50 10000 1000000 --stages process merge
+    python benchmarks.py --output after.json --compare before.json
+
+Stages:
+    fetch    the HTTP request alone, then get_treasury_data against the local stand-in
+             server (cache miss with processing and persistence, 304 revalidation, hit)
+    process  process_treasury_data: original per-row version, vectorized, memo hit
+    persist  what a changed payload costs on disk: snapshot save and history append
+    merge    combine_coin_frames over BTC and ETH frames, as in the combined view
+    format   currency labels: per-cell format_currency vs format_currency_series
+    render   Plotly figure construction for the coin view and the what-if heatmap
+
+Payloads are synthetic (see fake_coingecko.py), so no network access or API
+key is needed. Results are written as JSON; --compare reports the ratio to an
+earlier run and exits non-zero when a timing regressed past --tolerance
+(and by more than --min-delta seconds).
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from itertools import count
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+import pandas as pd
+import plotly
+import plotly.express as px
+import plotly.graph_objects as go
+
+# Keep benchmark runs away from the app's real snapshot database
+os.environ.setdefault('TREASURY_SNAPSHOT_DB', os.path.join(tempfile.mkdtemp(), 'bench.db'))
+# The stand-in has no quota, so the client-side rate limit would only distort fetch timings
+os.environ.setdefault('COINGECKO_RATE_LIMIT', '0')
+
+import app  # noqa: E402
+from fake_coingecko import FakeCoinGecko  # noqa: E402
+
+STAGES = ['fetch', 'process', 'persist', 'merge', 'format', 'render']
+
+
+def process_treasury_data_rowwise(data: Dict, coin_id: str) -> pd.DataFrame:
+    """The original per-row implementation of process_treasury_data, kept as a baseline"""
+    if not data or 'companies' not in data:
+        return pd.DataFrame()
+
+    companies = []
+    for company in data['companies']:
+        companies.append({
+            'Name': company.get('name', 'Unknown'),
+            'Symbol': company.get('symbol', 'N/A'),
+            'Country': company.get('country', 'Unknown'),
+            'Total Holdings': company.get('total_holdings', 0),
+            'Entry Value': company.get('total_entry_value_usd', 0),
+            'Current Value': company.get('total_current_value_usd', 0),
+            '% of Total Supply': company.get('percentage_of_total_supply', 0)
+        })
+
+    df = pd.DataFrame(companies)
+    if not df.empty:
+        df['PnL'] = (df['Current Value'] - df['Entry Value']).fillna(0)
+        df['PnL %'] = df.apply(lambda r: ((r['PnL'] / r['Entry Value']) * 100) if r['Entry Value'] and r['Entry Value'] != 0 else 0, axis=1)
+        df = df.sort_values('Total Holdings', ascending=False)
+
+    return df
+
+
+def best_of(fn: Callable[[], object], repeat: int) -> float:
+    """Fastest wall time of fn over repeat runs, in seconds"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def repeats_for(n: int) -> int:
+    return 5 if n <= 10_000 else 3 if n <= 100_000 else 1
+
+
+def coin_figures(tracker: app.TreasuryTracker, df: pd.DataFrame) -> List[go.Figure]:
+    """The supply donut and top-10 bar chart display_coin_data builds"""
+    share = float(np.clip(df['% of Total Supply'].sum(), 0, 100))
+    pie = px.pie(values=[share, 100 - share], names=['Public Companies', 'Others'], hole=0.6)
+    top = df.nlargest(10, 'Current Value')
+    bar = px.bar(top, x='Name', y='Current Value', text=tracker.format_currency_series(top['Current Value'], 'USD'))
+    return [pie, bar]
+
+
+def what_if_heatmap(combined: pd.DataFrame) -> go.Figure:
+    """The BTC x ETH PnL heatmap of the what-if section"""
+    engine = app.ScenarioEngine(combined, ['BTC', 'ETH'])
+    x = np.linspace(0, 200_000, app.WHAT_IF_GRID_SIZE)
+    y = np.linspace(0, 10_000, app.WHAT_IF_GRID_SIZE)
+    return go.Figure(go.Heatmap(x=x, y=y, z=engine.pnl_grid('BTC', x, 'ETH', y), zmid=0))
+
+
+def run(sizes: List[int], stages: List[str], latency: float) -> List[Dict[str, Any]]:
+    results: List[Dict[str, Any]] = []
+
+    def record(stage: str, variant: str, n: int, fn: Callable[[], object], repeat: int) -> None:
+        seconds = best_of(fn, repeat)
+        results.append({'stage': stage, 'variant': variant, 'companies': n, 'seconds': seconds, 'repeat': repeat})
+        print(f"{stage:>8} {variant:>12} {n:>10,} {seconds * 1e3:>12.2f} ms", flush=True)
+
+    print(f"{'stage':>8} {'variant':>12} {'companies':>10} {'best':>15}")
+    with FakeCoinGecko(latency=latency) as fake:
+        tracker = app.TreasuryTracker(fake.base_url, fake.fx_url)
+        fx_rates = tracker.get_usd_fx_rates()
+        for n in sizes:
+            fake.reset()
+            fake.companies = n
+            repeat = repeats_for(n)
+
+            def http_fetch() -> Dict:
+                # Download and parse only: no digest, processing, snapshot or history
+                tracker.http.clear()
+                return tracker.http.get_json(f"{tracker.base_url}/companies/public_treasury/bitcoin",
+                                             'public_treasury')[0]
+
+            def cold_fetch() -> Dict:
+                tracker.cache.clear()
+                tracker.http.clear()
+                return tracker.get_treasury_data('bitcoin')
+
+            def revalidated_fetch() -> Dict:
+                # Expired in memory, but the client still holds the ETag: the server answers 304
+                tracker.cache.clear()
+                return tracker.get_treasury_data('bitcoin')
+
+            if 'fetch' in stages:
+                record('fetch', 'http get', n, http_fetch, repeat)
+                record('fetch', 'cache miss', n, cold_fetch, repeat)
+                record('fetch', 'revalidated', n, revalidated_fetch, repeat)
+                record('fetch', 'cache hit', n, lambda: tracker.get_treasury_data('bitcoin'), 5)
+            # Later stages work on exactly what the app would have fetched
+            tracker.cache.clear()
+            tracker.http.clear()
+            btc = tracker.get_treasury_data('bitcoin')
+            eth = tracker.get_treasury_data('ethereum')
+
+            if 'process' in stages:
+                record('process', 'rowwise', n, lambda: process_treasury_data_rowwise(btc, 'bitcoin'), repeat)
+                record('process', 'vectorized', n, lambda: tracker._process_treasury_data(btc), repeat)
+                tracker.process_treasury_data(btc, 'bitcoin')
+                record('process', 'memo hit', n, lambda: tracker.process_treasury_data(btc, 'bitcoin'), 5)
+
+            frames = {'BTC': tracker.process_treasury_data(btc, 'bitcoin'),
+                      'ETH': tracker.process_treasury_data(eth, 'ethereum')}
+            if 'persist' in stages:
+                # Every append gets a new digest, or the history would skip it as a repeat
+                appends = count(1)
+                record('persist', 'snapshot', n, lambda: tracker.store.save('treasury_bitcoin', btc), repeat)
+                record('persist', 'history', n,
+                       lambda: tracker.history.append('bitcoin', frames['BTC'], f"bench-{next(appends)}"), repeat)
+            if 'merge' in stages:
+                record('merge', 'company ids', n, lambda: app.combine_coin_frames(frames, tracker.company_index), repeat)
+
+            money = frames['BTC'][['Entry Value', 'Current Value', 'PnL']]
+            if 'format' in stages:
+                record('format', 'per-cell', n,
+                       lambda: money.apply(lambda col: col.map(lambda v: tracker.format_currency(v, 'EUR', fx_rates))), repeat)
+                record('format', 'batch', n,
+                       lambda: money.apply(lambda col: tracker.format_currency_series(col, 'EUR', fx_rates)), repeat)
+
+            if 'render' in stages:
+                combined = app.combine_coin_frames(frames, tracker.company_index)
+                record('render', 'coin figures', n, lambda: coin_figures(tracker, frames['BTC']), repeat)
+                record('render', 'what-if grid', n, lambda: what_if_heatmap(combined), repeat)
+    return results
+
+
+def environment() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'plotly': plotly.__version__,
+    }
+
+
+def compare(previous: Dict[str, Any], results: List[Dict[str, Any]], tolerance: float,
+            min_delta: float) -> List[str]:
+    """Print the ratio to an earlier run and return the timings slower by both tolerance and min_delta"""
+    before = {(r['stage'], r['variant'], r['companies']): r['seconds'] for r in previous['results']}
+    regressions = []
+    print(f"\nCompared with {previous['environment'].get('commit') or 'previous run'}:")
+    for r in results:
+        key = (r['stage'], r['variant'], r['companies'])
+        if not before.get(key):
+            continue
+        ratio = r['seconds'] / before[key]
+        # Sub-millisecond timings jitter by more than any sensible ratio
+        flag = ' REGRESSION' if ratio > tolerance and r['seconds'] - before[key] > min_delta else ''
+        print(f"{r['stage']:>8} {r['variant']:>12} {r['companies']:>10,} {ratio:>7.2f}x{flag}")
+        if flag:
+            regressions.append(f"{r['stage']}/{r['variant']}/{r['companies']}")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[50, 1_000, 10_000, 100_000, 1_000_000],
+                        help='number of synthetic companies per payload')
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds the stand-in server adds per response')
+    parser.add_argument('--output', default='benchmark_results.json', help='where to write the JSON results')
+    parser.add_argument('--compare', metavar='JSON', help='earlier --output file to compare against')
+    parser.add_argument('--tolerance', type=float, default=1.25,
+                        help='slowdown ratio reported as a regression by --compare')
+    parser.add_argument('--min-delta', type=float, default=0.002,
+                        help='seconds a timing must also slow down by to count as a regression')
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.stages, args.latency)
+    with open(args.output, 'w') as f:
+        json.dump({'environment': environment(), 'results': results}, f, indent=2)
+    print(f"\nWrote {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), results, args.tolerance, args.min_delta)
+        if regressions:
+            print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
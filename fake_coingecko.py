@@ -0,0 +1,303 @@
+"""Local stand-in for the CoinGecko and FX APIs used by app.py.
+
+Serves synthetic payloads of configurable size and latency, or records real
+responses to a directory and replays them, so the fetch, processing and
+render pipeline can run reproducibly without network access or rate limits.
+Responses carry an ETag and If-None-Match gets a 304, unless --no-etags is set.
+
+Run with:
+    python fake_coingecko.py --companies 10000 --latency 0.05
+    python fake_coingecko.py --record recordings/   # proxy the real APIs and save every response
+    python fake_coingecko.py --replay recordings/   # serve the saved responses back
+
+Then point the app at it:
+    COINGECKO_BASE_URL=http://127.0.0.1:8765/api/v3 \\
+    FX_API_URL=http://127.0.0.1:8765/v6/latest/USD streamlit run app.py
+"""
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import numpy as np
+import requests
+
+# Prices and supplies the synthetic payloads are built around
+COIN_PRICES = {'bitcoin': 60_000.0, 'ethereum': 3_000.0}
+COIN_SUPPLY = {'bitcoin': 21_000_000, 'ethereum': 120_000_000}
+FX_RATES = {'USD': 1.0, 'EUR': 0.92, 'GBP': 0.79, 'JPY': 150.0, 'CAD': 1.36, 'AUD': 1.52}
+COUNTRIES = ['US', 'CA', 'GB', 'DE', 'JP', 'CN', 'AU', 'SG', 'HK', 'CH']
+
+# Local path prefix -> real API it stands in for
+UPSTREAMS = {
+    '/api/v3': 'https://api.coingecko.com/api/v3',
+    '/v6': 'https://open.er-api.com/v6',
+}
+
+
+def synthetic_treasury_payload(n: int, coin_id: str = 'bitcoin', seed: int = 0) -> Dict:
+    """Build a public_treasury-shaped payload with n companies"""
+    rng = np.random.default_rng(seed)
+    price = COIN_PRICES.get(coin_id, 100.0)
+    supply = COIN_SUPPLY.get(coin_id, 1_000_000_000)
+    holdings = rng.lognormal(mean=6, sigma=2, size=n).round(2)
+    entry = holdings * price * rng.uniform(0.2, 1.8, size=n)
+    # A few companies never disclosed an entry value
+    entry[rng.random(n) < 0.05] = 0
+    current = holdings * price
+    countries = rng.choice(COUNTRIES, size=n)
+    companies = [
+        {
+            'name': f'Company {i}',
+            'symbol': f'C{i}:XX',
+            'country': str(countries[i]),
+            'total_holdings': float(holdings[i]),
+            'total_entry_value_usd': float(entry[i]),
+            'total_current_value_usd': float(current[i]),
+            'percentage_of_total_supply': float(holdings[i] / supply * 100),
+        }
+        for i in range(n)
+    ]
+    return {
+        'total_holdings': float(holdings.sum()),
+        'total_value_usd': float(current.sum()),
+        'market_cap_dominance': float(holdings.sum() / supply * 100),
+        'companies': companies,
+    }
+
+
+def synthetic_exchange_rates() -> Dict:
+    """/exchange_rates payload: BTC-denominated rates consistent with COIN_PRICES and FX_RATES"""
+    btc_usd = COIN_PRICES['bitcoin']
+    rates = {
+        'btc': {'name': 'Bitcoin', 'unit': 'BTC', 'value': 1.0, 'type': 'crypto'},
+        'eth': {'name': 'Ether', 'unit': 'ETH', 'value': btc_usd / COIN_PRICES['ethereum'], 'type': 'crypto'},
+    }
+    for code, rate in FX_RATES.items():
+        rates[code.lower()] = {'name': code, 'unit': code, 'value': btc_usd * rate, 'type': 'fiat'}
+    return {'rates': rates}
+
+
+def synthetic_fx_rates() -> Dict:
+    """open.er-api /latest/USD payload"""
+    return {'result': 'success', 'base_code': 'USD', 'rates': dict(FX_RATES)}
+
+
+def synthetic_spot_prices(coin_ids: List[str]) -> Dict:
+    """/simple/price payload in USD"""
+    return {coin_id: {'usd': COIN_PRICES.get(coin_id, 100.0)} for coin_id in coin_ids}
+
+
+def synthetic_market_chart(coin_id: str, days: int, seed: int = 0) -> Dict:
+    """/coins/{id}/market_chart payload: daily closes ending at today's synthetic price"""
+    rng = np.random.default_rng(seed)
+    returns = rng.normal(0, 0.03, size=days)
+    closes = COIN_PRICES.get(coin_id, 100.0) * np.exp(returns.cumsum() - returns.sum())
+    now_ms = int(time.time() // 86400 * 86400 * 1000)
+    stamps = now_ms - 86_400_000 * np.arange(days)[::-1]
+    return {'prices': [[int(t), float(p)] for t, p in zip(stamps, closes)]}
+
+
+class FakeCoinGecko:
+    """Threaded HTTP server answering the endpoints app.TreasuryTracker calls.
+
+    In the default synthetic mode every response is generated locally;
+    companies and latency can be changed between requests. With record_dir
+    set, requests are proxied to the real APIs and each response is saved;
+    with replay_dir set, saved responses are served and anything unrecorded
+    gets a 404. With etags on, every 200 carries an ETag of its body and a
+    matching If-None-Match is answered with an empty 304.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, companies: int = 1000, latency: float = 0.0,
+                 seed: int = 0, record_dir: Optional[str] = None, replay_dir: Optional[str] = None,
+                 etags: bool = True):
+        self.companies = companies
+        self.latency = latency
+        self.seed = seed
+        self.record_dir = record_dir
+        self.replay_dir = replay_dir
+        self.etags = etags
+        self.requests = 0
+        self.not_modified = 0
+        self._bodies: Dict[Tuple[Any, ...], bytes] = {}
+        self._etags: Dict[int, Tuple[bytes, str]] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.server = ThreadingHTTPServer((host, port), _Handler)
+        self.server.daemon_threads = True
+        self.server.fake = self
+        if record_dir:
+            os.makedirs(record_dir, exist_ok=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def base_url(self) -> str:
+        """Value for COINGECKO_BASE_URL / TreasuryTracker(base_url=...)"""
+        return f"{self.url}/api/v3"
+
+    @property
+    def fx_url(self) -> str:
+        """Value for FX_API_URL / TreasuryTracker(fx_url=...)"""
+        return f"{self.url}/v6/latest/USD"
+
+    def start(self) -> 'FakeCoinGecko':
+        """Serve from a daemon thread and return self"""
+        self._thread = threading.Thread(target=self.server.serve_forever, name="fake-coingecko", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def reset(self) -> None:
+        """Drop the encoded synthetic payloads, e.g. between benchmark sizes"""
+        with self._lock:
+            self._bodies.clear()
+            self._etags.clear()
+
+    def __enter__(self) -> 'FakeCoinGecko':
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def respond(self, path: str, query: Dict[str, str], headers: Dict[str, str]) -> Tuple[int, bytes, Optional[str]]:
+        """Status, JSON body and ETag (if any) for one GET request"""
+        with self._lock:
+            self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if self.replay_dir:
+            status, body = self._replay(path, query)
+        elif self.record_dir:
+            status, body = self._record(path, query, headers)
+        else:
+            status, payload = self._synthetic(path, query)
+            body = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+        etag = self._etag(body) if self.etags and status == 200 else None
+        if etag is not None and headers.get('If-None-Match') == etag:
+            with self._lock:
+                self.not_modified += 1
+            return 304, b'', etag
+        return status, body, etag
+
+    def _etag(self, body: bytes) -> str:
+        # Hashing a large treasury body costs more than serving it, so those are memoized
+        with self._lock:
+            cached = self._etags.get(id(body))
+        if cached is not None and cached[0] is body:
+            return cached[1]
+        etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+        if len(body) > 2**20:
+            with self._lock:
+                self._etags[id(body)] = (body, etag)
+        return etag
+
+    def _synthetic(self, path: str, query: Dict[str, str]) -> Tuple[int, Any]:
+        parts = path.strip('/').split('/')
+        if parts[:4] == ['api', 'v3', 'companies', 'public_treasury'] and len(parts) == 5:
+            return 200, self._treasury_body(parts[4])
+        if parts == ['api', 'v3', 'exchange_rates']:
+            return 200, synthetic_exchange_rates()
+        if parts == ['api', 'v3', 'simple', 'price']:
+            return 200, synthetic_spot_prices([c for c in query.get('ids', '').split(',') if c])
+        if parts[:3] == ['api', 'v3', 'coins'] and parts[4:] == ['market_chart']:
+            return 200, synthetic_market_chart(parts[3], int(query.get('days', 365)), self.seed)
+        if parts == ['v6', 'latest', 'USD']:
+            return 200, synthetic_fx_rates()
+        return 404, {'error': f'not found: {path}'}
+
+    def _treasury_body(self, coin_id: str) -> bytes:
+        # Encoded once per size so the server does not dominate fetch timings
+        key = (coin_id, self.companies, self.seed)
+        with self._lock:
+            body = self._bodies.get(key)
+        if body is None:
+            body = json.dumps(synthetic_treasury_payload(self.companies, coin_id, self.seed)).encode()
+            with self._lock:
+                self._bodies[key] = body
+        return body
+
+    def _recording_path(self, directory: str, path: str, query: Dict[str, str]) -> str:
+        name = path.strip('/').replace('/', '__')
+        if query:
+            name += '__' + hashlib.sha256(urlencode(sorted(query.items())).encode()).hexdigest()[:12]
+        return os.path.join(directory, f"{name}.json")
+
+    def _record(self, path: str, query: Dict[str, str], headers: Dict[str, str]) -> Tuple[int, bytes]:
+        prefix = next((p for p in UPSTREAMS if path.startswith(p + '/')), None)
+        if prefix is None:
+            return 404, json.dumps({'error': f'no upstream for {path}'}).encode()
+        api_key = headers.get('X-CG-API-KEY') or os.getenv('COINGECKO_API_KEY')
+        response = requests.get(UPSTREAMS[prefix] + path[len(prefix):], params=query, timeout=30,
+                                headers={'X-CG-API-KEY': api_key} if api_key else None)
+        recording = {'path': path, 'query': query, 'status': response.status_code, 'body': response.text}
+        with open(self._recording_path(self.record_dir, path, query), 'w') as f:
+            json.dump(recording, f)
+        return response.status_code, response.content
+
+    def _replay(self, path: str, query: Dict[str, str]) -> Tuple[int, bytes]:
+        try:
+            with open(self._recording_path(self.replay_dir, path, query)) as f:
+                recording = json.load(f)
+        except FileNotFoundError:
+            return 404, json.dumps({'error': f'no recording for {path}'}).encode()
+        return recording['status'], recording['body'].encode()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self) -> None:
+        url = urlsplit(self.path)
+        status, body, etag = self.server.fake.respond(url.path, dict(parse_qsl(url.query)), dict(self.headers))
+        self.send_response(status)
+        if etag is not None:
+            self.send_header('ETag', etag)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--companies', type=int, default=1000, help='companies per synthetic public_treasury payload')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-etags', action='store_true', help='send no ETag, so clients fall back to body hashes')
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--record', metavar='DIR', help='proxy the real APIs and save responses to DIR')
+    mode.add_argument('--replay', metavar='DIR', help='serve responses saved by --record from DIR')
+    args = parser.parse_args()
+
+    fake = FakeCoinGecko(args.host, args.port, args.companies, args.latency, args.seed, args.record, args.replay,
+                         etags=not args.no_etags)
+    print(f"COINGECKO_BASE_URL={fake.base_url}")
+    print(f"FX_API_URL={fake.fx_url}")
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        fake.server.server_close()
+
+
+if __name__ == '__main__':
+    main()
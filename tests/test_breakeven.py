@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app import BreakevenIndex
+
+
+def make_holdings(rng, n):
+    holdings = rng.integers(0, 50, n).astype(float)
+    entry = holdings * rng.choice([0.0, 20_000.0, 40_000.0, 60_000.0], n) * rng.uniform(0.5, 1.5, n).round(1)
+    return pd.DataFrame({'Total Holdings': holdings, 'Entry Value': entry})
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_underwater_matches_brute_force(seed):
+    rng = np.random.default_rng(seed)
+    df = make_holdings(rng, 200)
+    index = BreakevenIndex(df)
+
+    known = df[(df['Total Holdings'] > 0) & (df['Entry Value'] > 0)]
+    breakeven = known['Entry Value'] / known['Total Holdings']
+    # Random prices plus every breakeven itself, where ties decide the count
+    prices = np.concatenate([rng.uniform(0, 120_000, 50), breakeven.to_numpy(), [0.0]])
+    result = index.underwater(prices)
+
+    for price, row in zip(prices, result.to_dict('records')):
+        under = known[breakeven > price]
+        value = price * under['Total Holdings'].sum()
+        assert row['Underwater Companies'] == len(under)
+        assert row['Underwater %'] == pytest.approx(len(under) * 100 / len(known))
+        assert row['Underwater Value'] == pytest.approx(value)
+        assert row['Unrealized Loss'] == pytest.approx(value - under['Entry Value'].sum())
+
+
+@pytest.mark.parametrize("share", [0.01, 0.25, 0.5, 1.0])
+def test_price_for_underwater_share_matches_brute_force(share):
+    index = BreakevenIndex(make_holdings(np.random.default_rng(7), 200))
+    needed = int(np.ceil(share * len(index)))
+
+    price = index.price_for_underwater_share(share)
+    # Just below the price enough companies are underwater; at the price itself not yet
+    assert (index.breakeven > np.nextafter(price, 0)).sum() >= needed
+    assert (index.breakeven > price).sum() < needed
+
+
+def test_no_cost_basis():
+    index = BreakevenIndex(pd.DataFrame({'Total Holdings': [0.0, 5.0], 'Entry Value': [100.0, 0.0]}))
+    assert len(index) == 0
+    assert index.price_for_underwater_share(0.5) is None
+    assert index.underwater([10.0])['Underwater Companies'].tolist() == [0]
@@ -0,0 +1,43 @@
+import time
+
+from app import BackgroundRefresher, TTLCache
+
+
+def test_entries_past_max_stale_are_evicted():
+    cache = TTLCache(ttl=10, max_stale=60)
+    cache.set("key", "value", stored_at=time.time() - 120)
+    assert cache.get_entry("key") is None
+
+
+def test_kept_entries_survive_max_stale_until_replaced():
+    cache = TTLCache(ttl=10, max_stale=60)
+    stored_at = time.time() - 3 * 24 * 3600
+    cache.set("snapshot", "last known good", stored_at=stored_at, keep=True)
+    # Evicting for another key's sake leaves it alone too
+    cache.set("other", "value")
+
+    assert cache.get_entry("snapshot") == (stored_at, "last known good")
+    assert cache.get("snapshot") is None
+    assert cache.age("snapshot") >= 3 * 24 * 3600
+
+    # A refreshed value is an ordinary entry again
+    cache.set("snapshot", "fresh", stored_at=time.time() - 120)
+    assert cache.get_entry("snapshot") is None
+
+
+def test_refresher_drops_idle_keys():
+    cache = TTLCache(ttl=0.01)
+    refresher = BackgroundRefresher(cache, interval=0.01, idle_timeout=0.05)
+    loads = []
+    refresher.register("fallback", lambda: loads.append(1) or len(loads))
+
+    deadline = time.monotonic() + 5
+    while not loads and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert loads
+
+    # Not requested again: the sweep forgets it after idle_timeout
+    time.sleep(0.2)
+    settled = len(loads)
+    time.sleep(0.1)
+    assert len(loads) == settled
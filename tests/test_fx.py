@@ -0,0 +1,44 @@
+import pytest
+
+from app import CURRENCY_SYMBOLS, UpstreamError, usd_cross_rates
+
+# Fiat per USD the payloads below are built from
+PER_USD = {"USD": 1.0, "EUR": 0.92, "GBP": 0.79, "JPY": 151.3, "CAD": 1.37, "AUD": 1.52}
+
+
+def exchange_rates(btc_usd, per_usd):
+    """CoinGecko's exchange_rates payload: every rate is units per BTC"""
+    rates = {code.lower(): {'name': code, 'unit': CURRENCY_SYMBOLS[code], 'value': btc_usd * rate, 'type': 'fiat'}
+             for code, rate in per_usd.items()}
+    rates['btc'] = {'name': 'Bitcoin', 'unit': 'BTC', 'value': 1.0, 'type': 'crypto'}
+    rates['eth'] = {'name': 'Ether', 'unit': 'ETH', 'value': 19.5, 'type': 'crypto'}
+    return rates
+
+
+@pytest.mark.parametrize("btc_usd", [0.5, 60_000.0, 1.23e7])
+def test_cross_rates_recover_fiat_per_usd(btc_usd):
+    rates = usd_cross_rates(exchange_rates(btc_usd, PER_USD))
+    assert rates.keys() == PER_USD.keys()
+    for code, rate in PER_USD.items():
+        assert rates[code] == pytest.approx(rate, rel=1e-12)
+
+
+def test_cross_rates_between_two_fiats():
+    payload = exchange_rates(60_000.0, PER_USD)
+    rates = usd_cross_rates(payload)
+    # EUR -> GBP through USD equals the direct quote of the two per BTC
+    assert rates["GBP"] / rates["EUR"] == pytest.approx(payload['gbp']['value'] / payload['eur']['value'])
+
+
+def test_currencies_without_a_positive_rate_are_left_out():
+    payload = exchange_rates(60_000.0, {**PER_USD, "JPY": 0.0})
+    del payload['cad']
+    payload['aud']['value'] = None
+    assert usd_cross_rates(payload).keys() == {"USD", "EUR", "GBP"}
+
+
+def test_missing_usd_rate_raises():
+    payload = exchange_rates(60_000.0, PER_USD)
+    del payload['usd']
+    with pytest.raises(UpstreamError):
+        usd_cross_rates(payload)
@@ -0,0 +1,264 @@
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+import pytest
+import requests
+
+import app
+from app import CircuitBreaker, CircuitOpenError, HttpClient, SingleFlight, TokenBucket, UpstreamError
+
+URL = "http://upstream.test/api"
+
+
+def make_response(status: int, headers=None, body: bytes = b"{}") -> requests.Response:
+    response = requests.Response()
+    response.status_code = status
+    response.headers.update(headers or {})
+    response._content = body
+    return response
+
+
+class StubSession:
+    """Answers GETs from a script of responses (or exceptions); the last entry repeats"""
+
+    def __init__(self, *script):
+        self.script = list(script)
+        self.calls = 0
+        self.headers = []
+
+    def get(self, url, params=None, headers=None, timeout=None):
+        item = self.script[min(self.calls, len(self.script) - 1)]
+        self.calls += 1
+        self.headers.append(headers or {})
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Record retry sleeps instead of waiting"""
+    slept = []
+    monkeypatch.setattr(app.time, "sleep", slept.append)
+    return slept
+
+
+def test_retry_after_seconds(sleeps):
+    session = StubSession(make_response(429, {"Retry-After": "7"}), make_response(200))
+    client = HttpClient(session=session)
+
+    assert client.get(URL, "test").status_code == 200
+    assert session.calls == 2
+    assert sleeps == [7.0]
+
+
+def test_retry_after_http_date(sleeps):
+    retry_at = datetime.now(timezone.utc) + timedelta(seconds=10)
+    session = StubSession(make_response(503, {"Retry-After": format_datetime(retry_at, usegmt=True)}),
+                          make_response(200))
+    client = HttpClient(session=session)
+
+    assert client.get(URL, "test").status_code == 200
+    assert len(sleeps) == 1
+    # HTTP dates have second resolution
+    assert 8 <= sleeps[0] <= 10
+
+
+def test_retry_after_past_the_deadline_returns_the_response(sleeps):
+    session = StubSession(make_response(429, {"Retry-After": "120"}), make_response(200))
+    client = HttpClient(session=session, deadline=60)
+
+    assert client.get(URL, "test").status_code == 429
+    assert session.calls == 1
+    assert sleeps == []
+
+
+def test_backoff_gives_up_at_the_deadline(monkeypatch):
+    # Fake clock: sleeping advances it, so the deadline is reached without waiting
+    now = [0.0]
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        now[0] += seconds
+
+    monkeypatch.setattr(app.time, "monotonic", lambda: now[0])
+    monkeypatch.setattr(app.time, "sleep", sleep)
+    monkeypatch.setattr(app.random, "uniform", lambda low, high: high)
+    session = StubSession(requests.ConnectionError("refused"))
+    client = HttpClient(session=session, max_retries=10, backoff=1, deadline=5)
+
+    with pytest.raises(requests.ConnectionError):
+        client.get(URL, "test")
+    # Backoffs of 1 and 2 seconds fit; another 4 would end past the 5 second deadline
+    assert sleeps == [1, 2]
+    assert session.calls == 3
+
+
+def test_retries_stop_after_max_retries(sleeps):
+    session = StubSession(make_response(500))
+    client = HttpClient(session=session, max_retries=2)
+
+    assert client.get(URL, "test").status_code == 500
+    assert session.calls == 3
+    assert len(sleeps) == 2
+
+
+def test_get_json_sends_validators():
+    validators = {"ETag": '"v1"', "Last-Modified": "Sun, 18 Oct 2026 12:00:00 GMT"}
+    session = StubSession(make_response(200, validators, b'{"companies": []}'))
+    client = HttpClient(session=session)
+
+    client.get_json(URL, "test")
+    client.get_json(URL, "test")
+    assert session.headers == [{}, {"If-None-Match": '"v1"', "If-Modified-Since": "Sun, 18 Oct 2026 12:00:00 GMT"}]
+
+
+def test_get_json_not_modified_returns_the_previous_payload():
+    session = StubSession(make_response(200, {"ETag": '"v1"'}, b'{"companies": [1]}'), make_response(304))
+    client = HttpClient(session=session)
+
+    payload, changed = client.get_json(URL, "test")
+    assert payload == {"companies": [1]} and changed
+    again, changed = client.get_json(URL, "test")
+    assert again is payload and not changed
+
+
+def test_get_json_compares_body_hashes_without_validators():
+    first, second = b'{"companies": [1]}', b'{"companies": [2]}'
+    session = StubSession(make_response(200, body=first), make_response(200, body=first),
+                          make_response(200, body=second))
+    client = HttpClient(session=session)
+
+    payload, _ = client.get_json(URL, "test")
+    same, changed = client.get_json(URL, "test")
+    assert same is payload and not changed
+    assert session.headers[1] == {}
+    assert client.get_json(URL, "test") == ({"companies": [2]}, True)
+
+
+def test_get_json_not_modified_without_a_previous_response():
+    session = StubSession(make_response(304))
+    client = HttpClient(session=session)
+
+    with pytest.raises(UpstreamError):
+        client.get_json(URL, "test")
+
+
+def test_token_bucket_stays_under_its_rate():
+    bucket = TokenBucket(rate=50, capacity=5)
+    started = time.monotonic()
+    threads = [threading.Thread(target=lambda: [bucket.acquire() for _ in range(5)]) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # 20 tokens: the first 5 come from the burst, the other 15 at 50 per second
+    assert time.monotonic() - started >= 15 / 50 * 0.95
+
+
+def test_token_bucket_timeout():
+    bucket = TokenBucket(rate=1, capacity=1)
+    assert bucket.acquire() == 0
+    with pytest.raises(TimeoutError):
+        bucket.acquire(timeout=0.1)
+
+
+def test_token_bucket_pause():
+    bucket = TokenBucket(rate=100, capacity=10)
+    bucket.pause(0.2)
+    assert bucket.acquire() >= 0.2 * 0.95
+
+
+def test_token_bucket_pause_after_idle(monkeypatch):
+    # Fake clock: the bucket was last touched long ago, so its refill time is stale
+    now = [0.0]
+
+    def sleep(seconds):
+        now[0] += seconds
+
+    monkeypatch.setattr(app.time, "monotonic", lambda: now[0])
+    monkeypatch.setattr(app.time, "sleep", sleep)
+    bucket = TokenBucket(rate=1, capacity=5)
+    now[0] = 100.0
+    bucket.pause(2)
+    # The idle time only refills up to capacity before the pause; the pause itself still holds
+    assert bucket.acquire() == 3
+
+
+def test_single_flight_coalesces_concurrent_misses():
+    flights = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def load():
+        calls.append(1)
+        release.wait(5)
+        return {"loaded": len(calls)}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flights.do("key", load))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    deadline = time.monotonic() + 5
+    while flights.stats["shared"] < 4 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results == [{"loaded": 1}] * 5
+    assert flights.stats == {"executed": 1, "shared": 4}
+
+
+def test_single_flight_shares_exceptions_and_frees_the_key():
+    flights = SingleFlight()
+
+    def fail():
+        raise ValueError("upstream down")
+
+    with pytest.raises(ValueError):
+        flights.do("key", fail)
+    assert flights.do("key", lambda: 42) == 42
+
+
+def test_circuit_breaker_opens_at_threshold():
+    breaker = CircuitBreaker(failure_threshold=2)
+    assert not breaker.record_failure()
+    assert breaker.record_failure()
+    assert breaker.is_open
+    # Only the failure that opened the circuit reports it
+    assert not breaker.record_failure()
+    breaker.record_success()
+    assert not breaker.is_open and breaker.failures == 0
+
+
+def test_circuit_opens_then_closes_after_probe():
+    session = StubSession(make_response(503))
+    client = HttpClient(session=session, max_retries=0)
+    breaker = client.breaker("test")
+    breaker.failure_threshold = 2
+    breaker.reset_timeout = 0.05
+
+    assert client.get(URL, "test").status_code == 503
+    assert client.get(URL, "test").status_code == 503
+    assert client.open_circuits().keys() == {"test"}
+
+    # Open: fail fast without calling upstream
+    calls = session.calls
+    with pytest.raises(CircuitOpenError):
+        client.get(URL, "test")
+    assert session.calls == calls
+
+    # The background probe closes the circuit once the endpoint answers again
+    session.script = [make_response(200)]
+    deadline = time.monotonic() + 5
+    while breaker.is_open and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not breaker.is_open
+    assert client.open_circuits() == {}
+    assert client.get(URL, "test").status_code == 200
@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import app
+from app import MonteCarloSimulator, ScenarioEngine
+
+
+def make_holdings(rng, n):
+    """A combine_coin_frames-like table: some companies hold one coin, some both, some none"""
+    held = rng.integers(0, 100, (n, 2)).astype(float) * (rng.random((n, 2)) < 0.6)
+    prices = np.array([60_000.0, 3_000.0])
+    return pd.DataFrame({
+        'Company': [f'Company {i}' for i in range(n)],
+        'Symbol': [f'C{i}' for i in range(n)],
+        'Country': 'US',
+        'BTC Held': held[:, 0],
+        'ETH Held': held[:, 1],
+        'CurrentUSD_BTC': held[:, 0] * prices[0],
+        'CurrentUSD_ETH': held[:, 1] * prices[1],
+        'Total Entry Value': held @ prices * rng.uniform(0.5, 1.5, n),
+    })
+
+
+@pytest.mark.parametrize("workers", [0, 2])
+def test_company_risk_matches_per_company_percentiles(monkeypatch, workers):
+    rng = np.random.default_rng(3)
+    engine = ScenarioEngine(make_holdings(rng, 60), ['BTC', 'ETH'])
+    simulator = MonteCarloSimulator(engine, drift=[0.1, 0.2], volatility=[0.6, 0.8], correlation=np.eye(2))
+    prices = simulator.terminal_prices(2_001, 30, seed=1)
+    # Small chunks, so several of them (and the pool, with workers) are exercised
+    monkeypatch.setattr(app, 'SIMULATION_CHUNK_BYTES', 8 * len(prices) * 7)
+
+    risk = simulator.company_risk(prices, confidence=0.9, workers=workers)
+
+    single = (engine.held > 0).sum(axis=1) <= 1
+    assert single.any() and not single.all()
+    for i in range(len(engine.entry)):
+        # Brute force: every path's PnL for this company, then the percentiles
+        pnl = prices @ engine.held[i] - engine.entry[i]
+        low, median, high = np.percentile(pnl, [10, 50, 90])
+        row = risk.iloc[i]
+        assert row['PnL P10'] == pytest.approx(low, abs=1e-6)
+        assert row['PnL P50'] == pytest.approx(median, abs=1e-6)
+        assert row['PnL P90'] == pytest.approx(high, abs=1e-6)
+        assert row['VaR 90%'] == pytest.approx(max(row['Current PnL'] - low, 0), abs=1e-6)
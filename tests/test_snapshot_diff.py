@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app import diff_snapshots
+
+
+def make_snapshot(rng, companies):
+    """A process_treasury_data-like frame over companies, with some duplicate listings"""
+    rows = [companies[i] for i in rng.choice(len(companies), int(len(companies) * 0.8), replace=True)]
+    return pd.DataFrame({
+        'Name': [name for name, _ in rows],
+        'Symbol': [symbol for _, symbol in rows],
+        'Total Holdings': rng.choice([0.0, 10.0, 25.0, 100.0], len(rows)),
+        'Entry Value': rng.choice([0.0, 1e6, 5e6], len(rows)),
+    })
+
+
+def reference_diff(old, new):
+    """Row-by-row reference: sum duplicate listings, then classify each (Name, Symbol)"""
+    def totals(df):
+        sums = {}
+        columns = ['Name', 'Symbol', 'Total Holdings', 'Entry Value']
+        for name, symbol, held, entry in df[columns].itertuples(index=False):
+            before = sums.get((name, symbol), (0.0, 0.0))
+            sums[(name, symbol)] = (before[0] + held, before[1] + entry)
+        return sums
+
+    before, after = totals(old), totals(new)
+    changes = {}
+    for key in before.keys() | after.keys():
+        if key not in before:
+            changes[key] = 'new'
+        elif key not in after:
+            changes[key] = 'dropped'
+        elif before[key] != after[key]:
+            changes[key] = 'changed'
+        else:
+            changes[key] = 'unchanged'
+    return changes, before, after
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_diff_snapshots_matches_reference(seed):
+    rng = np.random.default_rng(seed)
+    companies = [(f'Company {i % 30}', f'C{i}') for i in range(40)]
+    old, new = make_snapshot(rng, companies), make_snapshot(rng, companies)
+    # One company carries over untouched, listed twice, and one only exists before
+    same = pd.DataFrame({'Name': 'Same Co', 'Symbol': 'SAME', 'Total Holdings': [10.0, 5.0], 'Entry Value': 1e6})
+    gone = pd.DataFrame({'Name': ['Gone Co'], 'Symbol': ['GONE'], 'Total Holdings': [1.0], 'Entry Value': [0.0]})
+    old = pd.concat([old, same, gone], ignore_index=True)
+    new = pd.concat([new, same.iloc[::-1]], ignore_index=True)
+
+    diff = diff_snapshots(old, new, include_unchanged=True)
+    changes, before, after = reference_diff(old, new)
+
+    assert set(changes.values()) == {'new', 'dropped', 'changed', 'unchanged'}
+    assert len(diff) == len(changes)
+    for row in diff.to_dict('records'):
+        key = (row['Name'], row['Symbol'])
+        assert row['Change'] == changes[key]
+        assert (row['Holdings Before'], row['Entry Value Before']) == before.get(key, (0.0, 0.0))
+        assert (row['Holdings After'], row['Entry Value After']) == after.get(key, (0.0, 0.0))
+        assert row['Holdings Change'] == row['Holdings After'] - row['Holdings Before']
+
+    # Ranked by the holdings move, then the entry value move
+    moves = list(zip(diff['Holdings Change'].abs(), diff['Entry Value Change'].abs()))
+    assert moves == sorted(moves, reverse=True)
+
+    changed_only = diff_snapshots(old, new)
+    assert set(changed_only['Change']) <= {'new', 'dropped', 'changed'}
+    assert len(changed_only) == sum(change != 'unchanged' for change in changes.values())
+
+
+def test_diff_against_an_empty_snapshot():
+    new = pd.DataFrame({'Name': ['A'], 'Symbol': ['A'], 'Total Holdings': [5.0], 'Entry Value': [1.0]})
+    assert diff_snapshots(pd.DataFrame(), new)['Change'].tolist() == ['new']
+    assert diff_snapshots(new, None)['Change'].tolist() == ['dropped']